@@ -36,7 +36,11 @@ class Config(metaclass=Singleton):
         self.device = "cuda:0"
         self.is_half = True
         self.use_jit = False
+        self.rmvpe_chunk_frames = 0  # >0 时 rmvpe 按块推理, 限制长音频的显存占用
+        self.rmvpe_chunk_batch = 1  # 按块推理时每次前向的块数
         self.n_cpu = 0
+        # >1 时 dio/harvest 分段交给进程池; 子进程以 spawn 启动, 入口需要 __main__ 保护
+        self.f0_n_cpu = 1
         self.gpu_name = None
         self.json_config = self.load_config_json()
         self.gpu_mem = None
@@ -49,6 +53,7 @@ class Config(metaclass=Singleton):
             self.dml,
             self.nocheck,
             self.update,
+            self.index_on_device,
         ) = self.arg_parse()
         self.instead = ""
         self.preprocess_per = 3.7
@@ -93,6 +98,11 @@ class Config(metaclass=Singleton):
         parser.add_argument(
             "--update", action="store_true", help="Update to latest assets"
         )
+        parser.add_argument(
+            "--index_on_device",
+            action="store_true",
+            help="Keep the retrieval index on the device for exact top-k search",
+        )
         cmd_opts = parser.parse_args()
 
         cmd_opts.port = cmd_opts.port if 0 <= cmd_opts.port <= 65535 else 7865
@@ -106,6 +116,7 @@ class Config(metaclass=Singleton):
             cmd_opts.dml,
             cmd_opts.nocheck,
             cmd_opts.update,
+            cmd_opts.index_on_device,
         )
 
     # has_mps is only available in nightly pytorch (for now) and MasOS 12.3+.
@@ -209,6 +220,7 @@ class Config(metaclass=Singleton):
             x_query = 5
             x_center = 30
             x_max = 32
+            self.rmvpe_chunk_frames = 3200
         if self.dml:
             logger.info("Use DirectML instead")
             import torch_directml
@@ -236,7 +248,12 @@ class CPUConfig(metaclass=Singleton):
         self.device = "cpu"
         self.is_half = False
         self.use_jit = False
+        self.index_on_device = False
+        self.rmvpe_chunk_frames = 0  # >0 时 rmvpe 按块推理, 限制长音频的显存占用
+        self.rmvpe_chunk_batch = 1  # 按块推理时每次前向的块数
         self.n_cpu = 1
+        # >1 时 dio/harvest 分段交给进程池; 子进程以 spawn 启动, 入口需要 __main__ 保护
+        self.f0_n_cpu = 1
         self.gpu_name = None
         self.json_config = self.load_config_json()
         self.gpu_mem = None
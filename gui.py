@@ -12,7 +12,6 @@ if sys.platform == "darwin":
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
-import multiprocessing
 
 flag_vc = False
 
@@ -24,74 +23,22 @@ def printt(strr, *args):
         print(strr % args)
 
 
-def phase_vocoder(a, b, fade_out, fade_in):
-    window = torch.sqrt(fade_out * fade_in)
-    fa = torch.fft.rfft(a * window)
-    fb = torch.fft.rfft(b * window)
-    absab = torch.abs(fa) + torch.abs(fb)
-    n = a.shape[0]
-    if n % 2 == 0:
-        absab[1:-1] *= 2
-    else:
-        absab[1:] *= 2
-    phia = torch.angle(fa)
-    phib = torch.angle(fb)
-    deltaphase = phib - phia
-    deltaphase = deltaphase - 2 * np.pi * torch.floor(deltaphase / 2 / np.pi + 0.5)
-    w = 2 * np.pi * torch.arange(n // 2 + 1).to(a) + deltaphase
-    t = torch.arange(n).unsqueeze(-1).to(a) / n
-    result = (
-        a * (fade_out**2)
-        + b * (fade_in**2)
-        + torch.sum(absab * torch.cos(w * t + phia), -1) * window / n
-    )
-    return result
-
-
-class Harvest(multiprocessing.Process):
-    def __init__(self, inp_q, opt_q):
-        multiprocessing.Process.__init__(self)
-        self.inp_q = inp_q
-        self.opt_q = opt_q
-
-    def run(self):
-        import numpy as np
-        import pyworld
-
-        while 1:
-            idx, x, res_f0, n_cpu, ts = self.inp_q.get()
-            f0, t = pyworld.harvest(
-                x.astype(np.double),
-                fs=16000,
-                f0_ceil=1100,
-                f0_floor=50,
-                frame_period=10,
-            )
-            res_f0[idx] = f0
-            if len(res_f0.keys()) >= n_cpu:
-                self.opt_q.put(ts)
-
-
 if __name__ == "__main__":
     import json
     import multiprocessing
     import re
     import threading
-    import time
-    from multiprocessing import Queue, cpu_count
+    from multiprocessing import cpu_count
     from infer.lib.audio import AudioIoProcess
+    from infer.lib.rtengine import GUIConfig, RealtimeEngine
+    from infer.lib.rtpipeline import PipelinedEngine
     from multiprocessing.shared_memory import SharedMemory
 
-    import librosa
-    from infer.modules.gui import TorchGate
     import numpy as np
     import FreeSimpleGUI as sg
     import sounddevice as sd
     import torch
-    import torch.nn.functional as F
-    import torchaudio.transforms as tat
 
-    import infer.lib.rtrvc as rtrvc
     from i18n.i18n import I18nAuto
     from configs import Config
 
@@ -104,36 +51,8 @@ if __name__ == "__main__":
     #     else ("mps" if torch.backends.mps.is_available() else "cpu")
     # )
     current_dir = os.getcwd()
-    inp_q = Queue()
-    opt_q = Queue()
+    # harvest 等 cpu 方法的分段进程数上限, 进程池由 Generator 按需创建
     n_cpu = min(cpu_count(), 8)
-    for _ in range(n_cpu):
-        p = Harvest(inp_q, opt_q)
-        p.daemon = True
-        p.start()
-
-    class GUIConfig:
-        def __init__(self) -> None:
-            self.pth_path: str = ""
-            self.index_path: str = ""
-            self.pitch: int = 0
-            self.formant: float = 0.0
-            self.sr_type: str = "sr_model"
-            self.block_time: float = 0.25  # s
-            self.threhold: int = -60
-            self.crossfade_time: float = 0.05
-            self.extra_time: float = 2.5
-            self.I_noise_reduce: bool = False
-            self.O_noise_reduce: bool = False
-            self.use_pv: bool = False
-            self.rms_mix_rate: float = 0.0
-            self.index_rate: float = 0.0
-            self.n_cpu: int = min(n_cpu, 4)
-            self.f0method: str = "fcpe"
-            self.sg_hostapi: str = ""
-            self.wasapi_exclusive: bool = False
-            self.sg_input_device: str = ""
-            self.sg_output_device: str = ""
 
     class GUI:
         def __init__(self) -> None:
@@ -147,6 +66,7 @@ if __name__ == "__main__":
             self.input_devices_indices = None
             self.output_devices_indices = None
             self.stream = None
+            self.pipeline = None
             self.in_mem = None
             self.out_mem = None
             self.in_buf = None
@@ -251,6 +171,24 @@ if __name__ == "__main__":
         def launcher(self):
             data = self.load()
             self.config.use_jit = False  # data.get("use_jit", self.config.use_jit)
+            self.gui_config.queue_size = data.get(
+                "queue_size", self.gui_config.queue_size
+            )
+            self.gui_config.drop_policy = data.get(
+                "drop_policy", self.gui_config.drop_policy
+            )
+            self.gui_config.gate_attack = data.get(
+                "gate_attack", self.gui_config.gate_attack
+            )
+            self.gui_config.gate_release = data.get(
+                "gate_release", self.gui_config.gate_release
+            )
+            self.gui_config.index_on_device = data.get(
+                "index_on_device", self.gui_config.index_on_device
+            )
+            self.gui_config.incremental_hubert = data.get(
+                "incremental_hubert", self.gui_config.incremental_hubert
+            )
             sg.theme("LightBlue3")
             # 获取当前输入设备支持的采样率（简单实现：用常见采样率，后续可扩展为自动探测）
             samplerate_list = self.samplerate_choices
@@ -667,6 +605,12 @@ if __name__ == "__main__":
                                 ].index(True)
                             ],
                             "samplerate": int(values["samplerate_select"]) if "samplerate_select" in values else self.selected_samplerate,
+                            "queue_size": self.gui_config.queue_size,
+                            "drop_policy": self.gui_config.drop_policy,
+                            "gate_attack": self.gui_config.gate_attack,
+                            "gate_release": self.gui_config.gate_release,
+                            "index_on_device": self.gui_config.index_on_device,
+                            "incremental_hubert": self.gui_config.incremental_hubert,
                         }
                         with open("configs/inuse/config.json", "w") as j:
                             json.dump(settings, j)
@@ -717,6 +661,12 @@ if __name__ == "__main__":
                     self.gui_config.use_pv = values["use_pv"]
                 elif event in ["vc", "im"]:
                     self.function = event
+                    if hasattr(self, "engine"):
+                        self.engine.function = event
+                elif event == "vc_error":
+                    self.stop_stream()
+                    printt("Realtime conversion stopped: %s", values[event])
+                    sg.popup(values[event])
                 elif event == "stop_vc" or event != "start_vc":
                     self.stop_stream()
 
@@ -782,113 +732,28 @@ if __name__ == "__main__":
 
         def start_vc(self):
             torch.cuda.empty_cache()
-            self.rvc = rtrvc.RVC(
-                self.gui_config.pitch,
-                self.gui_config.formant,
-                self.gui_config.pth_path,
-                self.gui_config.index_path,
-                self.gui_config.index_rate,
-                self.gui_config.n_cpu,
-                self.config.device,
-                self.config.use_jit,
-                self.config.is_half,
-                self.config.dml,
-            )
-            self.gui_config.samplerate = (
-                self.rvc.tgt_sr
-                if self.gui_config.sr_type == "sr_model"
-                else self.get_device_samplerate()
+            self.engine = RealtimeEngine(
+                self.gui_config,
+                self.config,
+                (
+                    None
+                    if self.gui_config.sr_type == "sr_model"
+                    else self.get_device_samplerate()
+                ),
             )
+            self.engine.function = self.function
+            self.rvc = self.engine.rvc
             self.gui_config.channels = self.get_device_channels()
-            self.zc = self.gui_config.samplerate // 100
-            self.block_frame = (
-                int(
-                    np.round(
-                        self.gui_config.block_time
-                        * self.gui_config.samplerate
-                        / self.zc
-                    )
-                )
-                * self.zc
-            )
-            self.block_frame_16k = 160 * self.block_frame // self.zc
-            self.crossfade_frame = (
-                int(
-                    np.round(
-                        self.gui_config.crossfade_time
-                        * self.gui_config.samplerate
-                        / self.zc
-                    )
-                )
-                * self.zc
-            )
-            self.sola_buffer_frame = min(self.crossfade_frame, 4 * self.zc)
-            self.sola_search_frame = self.zc
-            self.extra_frame = (
-                int(
-                    np.round(
-                        self.gui_config.extra_time
-                        * self.gui_config.samplerate
-                        / self.zc
-                    )
-                )
-                * self.zc
-            )
-            self.input_wav: torch.Tensor = torch.zeros(
-                self.extra_frame
-                + self.crossfade_frame
-                + self.sola_search_frame
-                + self.block_frame,
-                device=self.config.device,
-                dtype=torch.float32,
+            self.block_frame = self.engine.block_frame
+            self.pipeline = PipelinedEngine(
+                self.engine,
+                self.gui_config.queue_size,
+                self.gui_config.drop_policy,
+                # 在流水线线程中出错, 交给界面线程停止音频流并提示
+                on_error=lambda e: self.window.write_event_value(
+                    "vc_error", "%s: %s" % (type(e).__name__, e)
+                ),
             )
-            self.input_wav_denoise: torch.Tensor = self.input_wav.clone()
-            self.input_wav_res: torch.Tensor = torch.zeros(
-                160 * self.input_wav.shape[0] // self.zc,
-                device=self.config.device,
-                dtype=torch.float32,
-            )
-            self.rms_buffer: np.ndarray = np.zeros(4 * self.zc, dtype="float32")
-            self.sola_buffer: torch.Tensor = torch.zeros(
-                self.sola_buffer_frame, device=self.config.device, dtype=torch.float32
-            )
-            self.nr_buffer: torch.Tensor = self.sola_buffer.clone()
-            self.output_buffer: torch.Tensor = self.input_wav.clone()
-            self.skip_head = self.extra_frame // self.zc
-            self.return_length = (
-                self.block_frame + self.sola_buffer_frame + self.sola_search_frame
-            ) // self.zc
-            self.fade_in_window: torch.Tensor = (
-                torch.sin(
-                    0.5
-                    * np.pi
-                    * torch.linspace(
-                        0.0,
-                        1.0,
-                        steps=self.sola_buffer_frame,
-                        device=self.config.device,
-                        dtype=torch.float32,
-                    )
-                )
-                ** 2
-            )
-            self.fade_out_window: torch.Tensor = 1 - self.fade_in_window
-            self.resampler = tat.Resample(
-                orig_freq=self.gui_config.samplerate,
-                new_freq=16000,
-                dtype=torch.float32,
-            ).to(self.config.device)
-            if self.rvc.tgt_sr != self.gui_config.samplerate:
-                self.resampler2 = tat.Resample(
-                    orig_freq=self.rvc.tgt_sr,
-                    new_freq=self.gui_config.samplerate,
-                    dtype=torch.float32,
-                ).to(self.config.device)
-            else:
-                self.resampler2 = None
-            self.tg = TorchGate(
-                sr=self.gui_config.samplerate, n_fft=4 * self.zc, prop_decrease=0.9
-            ).to(self.config.device)
             self.start_stream()
 
         def start_stream(self):
@@ -933,16 +798,24 @@ if __name__ == "__main__":
 
                 self.stream.start()
 
-                def audio_loop():
+                def input_loop():
+                    while flag_vc:
+                        self.audio_input()
+
+                def output_loop():
                     while flag_vc:
-                        self.audio_infer(self.block_frame << 1)
+                        self.audio_output(self.block_frame << 1)
 
-                threading.Thread(target=audio_loop, daemon=True).start()
+                threading.Thread(target=input_loop, daemon=True).start()
+                threading.Thread(target=output_loop, daemon=True).start()
 
         def stop_stream(self):
             global flag_vc
             if flag_vc:
                 flag_vc = False
+                if self.pipeline is not None:
+                    self.pipeline.stop()
+                    self.engine.close()
                 if self.stream is not None:
                     print("Exiting")
                     self.stop_evt.set()
@@ -951,170 +824,30 @@ if __name__ == "__main__":
                     self.stream.join()
                     self.stream = None
 
-        def audio_infer(self, buf_size: int):  # 2 * self.block_frame
+        def audio_input(self):
             """
-            音频处理
+            读取一块输入交给流水线
             """
-            global flag_vc
-
             self.in_evt.wait()
             rptr = self.in_ptr.value
             self.in_evt.clear()
 
-            start_time = time.perf_counter()
-
             rend = rptr + self.block_frame
-            indata = np.copy(self.in_buf[rptr:rend])
+            self.pipeline.put(np.copy(self.in_buf[rptr:rend]))
 
-            indata = librosa.to_mono(indata.T)
-            if self.gui_config.threhold > -60:
-                indata = np.append(self.rms_buffer, indata)
-                rms = librosa.feature.rms(
-                    y=indata, frame_length=4 * self.zc, hop_length=self.zc
-                )[:, 2:]
-                self.rms_buffer[:] = indata[-4 * self.zc :]
-                indata = indata[2 * self.zc - self.zc // 2 :]
-                db_threhold = (
-                    librosa.amplitude_to_db(rms, ref=1.0)[0] < self.gui_config.threhold
-                )
-                for i in range(db_threhold.shape[0]):
-                    if db_threhold[i]:
-                        indata[i * self.zc : (i + 1) * self.zc] = 0
-                indata = indata[self.zc // 2 :]
-            self.input_wav[: -self.block_frame] = self.input_wav[
-                self.block_frame :
-            ].clone()
-            self.input_wav[-indata.shape[0] :] = torch.from_numpy(indata).to(
-                self.config.device
-            )
-            self.input_wav_res[: -self.block_frame_16k] = self.input_wav_res[
-                self.block_frame_16k :
-            ].clone()
-            # input noise reduction and resampling
-            if self.gui_config.I_noise_reduce:
-                self.input_wav_denoise[: -self.block_frame] = self.input_wav_denoise[
-                    self.block_frame :
-                ].clone()
-                input_wav = self.input_wav[-self.sola_buffer_frame - self.block_frame :]
-                input_wav = self.tg(
-                    input_wav.unsqueeze(0), self.input_wav.unsqueeze(0)
-                ).squeeze(0)
-                input_wav[: self.sola_buffer_frame] *= self.fade_in_window
-                input_wav[: self.sola_buffer_frame] += (
-                    self.nr_buffer * self.fade_out_window
-                )
-                self.input_wav_denoise[-self.block_frame :] = input_wav[
-                    : self.block_frame
-                ]
-                self.nr_buffer[:] = input_wav[self.block_frame :]
-                self.input_wav_res[-self.block_frame_16k - 160 :] = self.resampler(
-                    self.input_wav_denoise[-self.block_frame - 2 * self.zc :]
-                )[160:]
-            else:
-                self.input_wav_res[-160 * (indata.shape[0] // self.zc + 1) :] = (
-                    self.resampler(self.input_wav[-indata.shape[0] - 2 * self.zc :])[
-                        160:
-                    ]
-                )
-            # infer
-            if self.function == "vc":
-                infer_wav = self.rvc.infer(
-                    self.input_wav_res,
-                    self.block_frame_16k,
-                    self.skip_head,
-                    self.return_length,
-                    self.gui_config.f0method,
-                )
-                if self.resampler2 is not None:
-                    infer_wav = self.resampler2(infer_wav)
-            elif self.gui_config.I_noise_reduce:
-                infer_wav = self.input_wav_denoise[self.extra_frame :].clone()
-            else:
-                infer_wav = self.input_wav[self.extra_frame :].clone()
-            # output noise reduction
-            if self.gui_config.O_noise_reduce and self.function == "vc":
-                self.output_buffer[: -self.block_frame] = self.output_buffer[
-                    self.block_frame :
-                ].clone()
-                self.output_buffer[-self.block_frame :] = infer_wav[-self.block_frame :]
-                infer_wav = self.tg(
-                    infer_wav.unsqueeze(0), self.output_buffer.unsqueeze(0)
-                ).squeeze(0)
-            # volume envelop mixing
-            if self.gui_config.rms_mix_rate < 1 and self.function == "vc":
-                if self.gui_config.I_noise_reduce:
-                    input_wav = self.input_wav_denoise[self.extra_frame :]
-                else:
-                    input_wav = self.input_wav[self.extra_frame :]
-                rms1 = librosa.feature.rms(
-                    y=input_wav[: infer_wav.shape[0]].cpu().numpy(),
-                    frame_length=4 * self.zc,
-                    hop_length=self.zc,
-                )
-                rms1 = torch.from_numpy(rms1).to(self.config.device)
-                rms1 = F.interpolate(
-                    rms1.unsqueeze(0),
-                    size=infer_wav.shape[0] + 1,
-                    mode="linear",
-                    align_corners=True,
-                )[0, 0, :-1]
-                rms2 = librosa.feature.rms(
-                    y=infer_wav[:].cpu().numpy(),
-                    frame_length=4 * self.zc,
-                    hop_length=self.zc,
-                )
-                rms2 = torch.from_numpy(rms2).to(self.config.device)
-                rms2 = F.interpolate(
-                    rms2.unsqueeze(0),
-                    size=infer_wav.shape[0] + 1,
-                    mode="linear",
-                    align_corners=True,
-                )[0, 0, :-1]
-                rms2 = torch.max(rms2, torch.zeros_like(rms2) + 1e-3)
-                infer_wav *= torch.pow(
-                    rms1 / rms2, torch.tensor(1 - self.gui_config.rms_mix_rate)
-                )
-            # SOLA algorithm from https://github.com/yxlllc/DDSP-SVC
-            conv_input = infer_wav[
-                None, None, : self.sola_buffer_frame + self.sola_search_frame
-            ]
-            cor_nom = F.conv1d(conv_input, self.sola_buffer[None, None, :])
-            cor_den = torch.sqrt(
-                F.conv1d(
-                    conv_input**2,
-                    torch.ones(1, 1, self.sola_buffer_frame, device=self.config.device),
-                )
-                + 1e-8
-            )
-            if sys.platform == "darwin":
-                _, sola_offset = torch.max(cor_nom[0, 0] / cor_den[0, 0])
-                sola_offset = sola_offset.item()
-            else:
-                sola_offset = torch.argmax(cor_nom[0, 0] / cor_den[0, 0])
-            # printt("sola_offset = %d", int(sola_offset))
-            infer_wav = infer_wav[sola_offset:]
-            if "privateuseone" in str(self.config.device) or not self.gui_config.use_pv:
-                infer_wav[: self.sola_buffer_frame] *= self.fade_in_window
-                infer_wav[: self.sola_buffer_frame] += (
-                    self.sola_buffer * self.fade_out_window
-                )
-            else:
-                infer_wav[: self.sola_buffer_frame] = phase_vocoder(
-                    self.sola_buffer,
-                    infer_wav[: self.sola_buffer_frame],
-                    self.fade_out_window,
-                    self.fade_in_window,
-                )
-            self.sola_buffer[:] = infer_wav[
-                self.block_frame : self.block_frame + self.sola_buffer_frame
-            ]
-            outdata = (
-                infer_wav[: self.block_frame]
-                .repeat(self.gui_config.channels, 1)
-                .t()
-                .cpu()
-                .numpy()
-            )
+            if self.in_evt.is_set():
+                print("[W] Input overrun")
+                self.in_evt.clear()
+
+        def audio_output(self, buf_size: int):  # 2 * self.block_frame
+            """
+            从流水线取出一块输出写入共享缓冲区
+            """
+            global flag_vc
+
+            outdata = self.pipeline.get(timeout=0.1)
+            if outdata is None:
+                return
 
             # 装填输出缓冲
             start = self.out_ptr.value
@@ -1145,13 +878,8 @@ if __name__ == "__main__":
             # 更新写指针
             self.out_ptr.value = write_pos
 
-            if self.in_evt.is_set():
-                print("[W] Input overrun")
-                self.in_evt.clear()
-
-            total_time = time.perf_counter() - start_time
             if flag_vc:
-                self.window["infer_time"].update(int(total_time * 1000))
+                self.window["infer_time"].update(int(self.pipeline.latency * 1000))
             # printt("Infer time: %.2f", total_time)
 
         def update_devices(self, hostapi_name=None):
@@ -1,6 +1,6 @@
 from io import BufferedWriter, BytesIO
 from pathlib import Path
-from typing import Dict, Tuple, Optional, Union, List
+from typing import Dict, Tuple, Optional, Union, List, Iterator
 import os
 import math
 import wave
@@ -159,6 +159,41 @@ def load_audio(
     return decoded_audio, rate
 
 
+def load_audio_blocks(
+    file: Union[str, BytesIO, Path],
+    sr: int,
+    block_size: int,
+    format: Optional[str] = None,
+) -> Iterator[np.ndarray]:
+    """
+    逐包解码并重采样为单声道 float32, 每凑满 block_size 点产出一块,
+    最后一块可能不足 block_size
+    """
+    if (isinstance(file, str) and not Path(file).exists()) or (
+        isinstance(file, Path) and not file.exists()
+    ):
+        raise FileNotFoundError(f"File not found: {file}")
+
+    container = av.open(file, format=format)
+    try:
+        audio_stream = next(s for s in container.streams if s.type == "audio")
+        resampler = AudioResampler(format="fltp", layout=audio_stream.layout, rate=sr)
+        buf = np.zeros(0, dtype=np.float32)
+        for packet in container.demux(audio_stream):
+            frames_data = [buf]
+            for frame in packet.decode():
+                for resampled_frame in resampler.resample(frame):
+                    frames_data.append(resampled_frame.to_ndarray().mean(0))
+            buf = np.concatenate(frames_data)
+            while buf.shape[0] >= block_size:
+                yield buf[:block_size]
+                buf = buf[block_size:]
+        if buf.shape[0] > 0:
+            yield buf
+    finally:
+        container.close()
+
+
 def resample_audio(
     input_path: str, output_path: str, codec: str, format: str, sr: int, layout: str
 ) -> None:
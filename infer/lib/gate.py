@@ -0,0 +1,67 @@
+import torch
+import torch.nn.functional as F
+
+
+class NoiseGate(object):
+    """
+    实时输入的响度门限, 全部在 device 上以张量运算完成.
+
+    以 zc (10ms) 为一段, 每段的 rms 取以该段为中心的 4 * zc 点窗口
+    (同 librosa.feature.rms(frame_length=4 * zc, hop_length=zc)),
+    低于门限的段置零. 窗口需要 2 * zc 的后文, 因此每次输出比输入多出
+    前 2 * zc 点, 调用方应覆盖上一块末尾的这部分.
+
+    release (秒): 响度降到门限以下后保持打开的时长
+    attack (秒): 开关时增益线性渐变的时长, 避免硬切产生的咔嗒声
+    均为 0 时结果与逐段判断置零一致
+    """
+
+    def __init__(self, zc: int, device):
+        self.zc = zc
+        self.device = device
+        self.buffer = torch.zeros(4 * zc, device=device, dtype=torch.float32)
+        self.open_history = torch.zeros(0, device=device)
+        self.gain_history = torch.zeros(0, device=device)
+
+    def __call__(
+        self,
+        x: torch.Tensor,
+        threhold: float,
+        attack: float = 0.0,
+        release: float = 0.0,
+    ) -> torch.Tensor:
+        """
+        x 为 n_block * zc 点的新输入, 返回 (n_block + 2) * zc 点
+        """
+        zc = self.zc
+        n_block = x.shape[0] // zc
+        x = torch.cat((self.buffer, x))
+        self.buffer[:] = x[-4 * zc :]
+        # 各段能量, 末尾补 2 * zc 个 0 (同 librosa 的 center 补齐)
+        energy = F.pad(x, (0, 2 * zc)).view(-1, zc).square().sum(1)
+        # 第 t 帧覆盖第 t-2..t+1 段, 只需 t = 2..n_block+4
+        energy = F.conv1d(
+            energy[None, None], torch.ones(1, 1, 4, device=x.device, dtype=x.dtype)
+        )[0, 0]
+        rms = torch.sqrt(energy / (4 * zc))
+        is_open = (rms >= 10 ** (threhold / 20)).to(x.dtype)
+        # 本块前 n_block 段的判断不再随后续输入改变, 留作下一块的历史
+        n_release = int(round(release * 100))
+        if n_release > 0:
+            history = self.open_history[-n_release:]
+            history = F.pad(history, (n_release - history.shape[0], 0))
+            self.open_history = torch.cat((history, is_open[:n_block]))
+            is_open = F.max_pool1d(
+                torch.cat((history, is_open))[None, None], n_release + 1, stride=1
+            )[0, 0]
+        # 第 i 段对应输出 [i * zc - zc // 2, (i + 1) * zc - zc // 2)
+        gain = is_open.repeat_interleave(zc)[zc // 2 : zc // 2 + (n_block + 2) * zc]
+        n_attack = int(round(attack * 100 * zc))
+        if n_attack > 1:
+            history = self.gain_history[-(n_attack - 1) :]
+            history = F.pad(history, (n_attack - 1 - history.shape[0], 0), value=1.0)
+            self.gain_history = torch.cat((history, gain[: n_block * zc]))
+            cum = torch.cumsum(torch.cat((history, gain)).double(), 0)
+            cum = F.pad(cum, (1, 0))
+            gain = ((cum[n_attack:] - cum[:-n_attack]) / n_attack).to(x.dtype)
+        return x[2 * zc :] * gain
@@ -0,0 +1,63 @@
+from typing import Tuple
+
+import torch
+
+
+class RingBuffer(object):
+    """
+    定长滑动窗口, 替代每块 x[:-n] = x[n:].clone() 的整体平移.
+
+    底层存储比窗口多出 slack 个位置, roll 只移动 head, 存储用尽时才把窗口
+    搬回开头一次, 因此 view() 始终是连续的视图, 可直接交给需要连续输入的
+    kernel. 每次 roll 之后此前取得的视图即失效, 需重新调用 view()
+    """
+
+    def __init__(
+        self,
+        size: int,
+        trailing_shape: Tuple[int, ...] = (),
+        device="cpu",
+        dtype=torch.float32,
+        slack: int = None,
+    ):
+        self.size = size
+        self.slack = max(size if slack is None else slack, 1)
+        self.data = torch.zeros(
+            (size + self.slack, *trailing_shape), device=device, dtype=dtype
+        )
+        self.head = size
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def shape(self):
+        return torch.Size((self.size, *self.data.shape[1:]))
+
+    def view(self) -> torch.Tensor:
+        return self.data[self.head - self.size : self.head]
+
+    def roll(self, n: int):
+        """
+        窗口前移 n 点, 末尾 n 点的内容未定义, 由调用方随后写入
+        """
+        if n >= self.size:
+            self.head = self.size
+            return
+        if self.head + n > self.data.shape[0]:
+            keep = self.data[self.head - self.size + n : self.head]
+            if self.head - self.size + n < self.size - n:  # 源与目标区间重叠
+                keep = keep.clone()
+            self.data[: self.size - n] = keep
+            self.head = self.size - n
+        self.head += n
+
+    def push(self, x: torch.Tensor):
+        if x.shape[0] == 0:
+            return
+        self.roll(x.shape[0])
+        self.view()[-x.shape[0] :] = x[-self.size :]
+
+    def clear(self):
+        self.data.zero_()
+        self.head = self.size
@@ -0,0 +1,289 @@
+from multiprocessing import cpu_count
+from typing import Optional, Union
+
+import numpy as np
+import torch
+
+from infer.lib.gate import NoiseGate
+from infer.lib.ringbuffer import RingBuffer
+from infer.lib.rtrvc import RVC
+from infer.lib.sola import SOLA
+from infer.modules.gui import TorchGate
+from rvc.profiler import null_profiler
+from rvc.resample import Resampler
+from rvc.rms import RMSMixer
+
+
+class GUIConfig:
+    def __init__(self) -> None:
+        self.pth_path: str = ""
+        self.index_path: str = ""
+        self.pitch: int = 0
+        self.formant: float = 0.0
+        self.sr_type: str = "sr_model"
+        self.block_time: float = 0.25  # s
+        self.threhold: int = -60
+        self.gate_attack: float = 0.0  # s, 门限开关时的渐变时长
+        self.gate_release: float = 0.0  # s, 低于门限后保持打开的时长
+        self.crossfade_time: float = 0.05
+        self.extra_time: float = 2.5
+        self.I_noise_reduce: bool = False
+        self.O_noise_reduce: bool = False
+        self.use_pv: bool = False
+        self.incremental_hubert: bool = False  # 只对新音频重新提取 hubert 特征
+        self.rms_mix_rate: float = 0.0
+        self.index_rate: float = 0.0
+        self.index_on_device: bool = False  # 索引常驻 device, 精确 top-k 检索
+        self.n_cpu: int = min(cpu_count(), 4)
+        self.f0method: str = "fcpe"
+        self.sg_hostapi: str = ""
+        self.wasapi_exclusive: bool = False
+        self.sg_input_device: str = ""
+        self.sg_output_device: str = ""
+        self.samplerate: int = 0  # 由 RealtimeEngine 确定
+        self.channels: int = 1
+        self.queue_size: int = 1  # 流水线各阶段间的队列长度
+        self.drop_policy: str = "drop_oldest"  # 见 PipelinedEngine
+
+
+class RealtimeEngine(object):
+    """
+    不依赖窗口与声卡的实时变声流程: 输入门限, 输入降噪, 重采样, RVC.infer,
+    输出降噪, 响度混合与 SOLA 拼接. 每次 process 输入输出各 block_frame 点.
+
+    门限, 降噪, 响度混合, f0 方法与相位声码器开关每块从 gui_config 读取,
+    可随时修改; 音高, 共振峰与索引占比通过 self.rvc 的 set_* 方法修改
+    """
+
+    def __init__(self, gui_config: GUIConfig, config, samplerate: Optional[int] = None):
+        """
+        samplerate 为输入输出的采样率, 为 None 时使用模型采样率
+        """
+        self.gui_config = gui_config
+        self.config = config
+        self.device = config.device
+        self.function = "vc"  # "vc" 输出变声, "im" 监听输入
+        # 已预处理 / 已推理 / 已后处理的块序号
+        self.seq = self.infer_seq = self.post_seq = 0
+        self.rvc = RVC(
+            gui_config.pitch,
+            gui_config.formant,
+            gui_config.pth_path,
+            gui_config.index_path,
+            gui_config.index_rate,
+            gui_config.n_cpu,
+            config.device,
+            config.use_jit,
+            config.is_half,
+            config.dml,
+            gui_config.index_on_device,
+            gui_config.incremental_hubert,
+        )
+        self.samplerate = samplerate or self.rvc.tgt_sr
+        gui_config.samplerate = self.samplerate
+        self.zc = self.samplerate // 100
+        self.block_frame = self._to_frames(gui_config.block_time)
+        self.block_frame_16k = 160 * self.block_frame // self.zc
+        self.crossfade_frame = self._to_frames(gui_config.crossfade_time)
+        self.sola_buffer_frame = min(self.crossfade_frame, 4 * self.zc)
+        self.sola_search_frame = self.zc
+        self.extra_frame = self._to_frames(gui_config.extra_time)
+        self.input_wav = RingBuffer(
+            self.extra_frame
+            + self.crossfade_frame
+            + self.sola_search_frame
+            + self.block_frame,
+            device=self.device,
+        )
+        self.input_wav_denoise = RingBuffer(len(self.input_wav), device=self.device)
+        self.input_wav_res = RingBuffer(
+            160 * len(self.input_wav) // self.zc, device=self.device
+        )
+        self.gate = NoiseGate(self.zc, self.device)
+        self.rms_mixer = RMSMixer(4 * self.zc, self.zc, self.device)
+        self.nr_buffer: torch.Tensor = torch.zeros(
+            self.sola_buffer_frame, device=self.device, dtype=torch.float32
+        )
+        self.output_buffer = RingBuffer(len(self.input_wav), device=self.device)
+        self.skip_head = self.extra_frame // self.zc
+        self.return_length = (
+            self.block_frame + self.sola_buffer_frame + self.sola_search_frame
+        ) // self.zc
+        self.sola = SOLA(
+            self.sola_buffer_frame,
+            self.sola_search_frame,
+            self.device,
+            jit=config.use_jit,
+        )
+        self.fade_in_window = self.sola.fade_in_window
+        self.fade_out_window = self.sola.fade_out_window
+        # 输入逐块流式重采样到 16k, 滤波器状态跨块保留, 16k 音频滞后约 (width +
+        # orig) 个输入点; 门限会改写上一块末尾 2 * zc 点, 16k 流保留首次的结果
+        self.resampler = Resampler(self.samplerate, 16000, self.device)
+        if self.rvc.tgt_sr != self.samplerate:
+            self.resampler2 = Resampler(self.rvc.tgt_sr, self.samplerate, self.device)
+        else:
+            self.resampler2 = None
+        # preprocess 与 postprocess 可能在不同线程中同时运行, 输入输出各用一个实例
+        self.input_tg = TorchGate(
+            sr=self.samplerate, n_fft=4 * self.zc, prop_decrease=0.9
+        ).to(self.device)
+        self.output_tg = TorchGate(
+            sr=self.samplerate, n_fft=4 * self.zc, prop_decrease=0.9
+        ).to(self.device)
+
+    def close(self):
+        """
+        停止使用后释放 rvc 持有的进程池
+        """
+        self.rvc.close()
+
+    def _to_frames(self, seconds: float) -> int:
+        return int(np.round(seconds * self.samplerate / self.zc)) * self.zc
+
+    @property
+    def delay_time(self) -> float:
+        """
+        不含声卡延迟的算法延迟 (秒)
+        """
+        delay = (self.block_frame + self.crossfade_frame) / self.samplerate + 0.01
+        if self.gui_config.I_noise_reduce:
+            delay += min(self.crossfade_frame / self.samplerate, 0.04)
+        return delay
+
+    def process(
+        self, indata: Union[np.ndarray, torch.Tensor], profiler=null_profiler
+    ) -> np.ndarray:
+        """
+        indata 为 (block_frame,) 或 (block_frame, 声道数) 的音频块,
+        返回 (block_frame, gui_config.channels) 的 float32 数组.
+        profiler 记录各阶段耗时, rvc.infer 内部记录 hubert/index/f0/synth
+        """
+        block = self.preprocess(indata, profiler, copy=False)
+        return self.postprocess(block, self.infer(block, profiler), profiler)
+
+    def preprocess(
+        self,
+        indata: Union[np.ndarray, torch.Tensor],
+        profiler=null_profiler,
+        copy=True,
+    ) -> dict:
+        """
+        门限, 输入降噪与重采样. copy 为 True 时返回的块持有 infer 与
+        postprocess 所需输入的拷贝, 可与下一块的 preprocess 并行处理
+        """
+        if not torch.is_tensor(indata):
+            indata = torch.from_numpy(np.asarray(indata, dtype=np.float32))
+        indata = indata.to(self.device, torch.float32)
+        if indata.dim() > 1:
+            indata = indata.mean(-1)
+        if self.gui_config.threhold > -60:
+            with profiler.stage("gate"):
+                indata = self.gate(
+                    indata,
+                    self.gui_config.threhold,
+                    self.gui_config.gate_attack,
+                    self.gui_config.gate_release,
+                )
+        self.input_wav.roll(self.block_frame)
+        self.input_wav.view()[-indata.shape[0] :] = indata
+        # input noise reduction and resampling
+        with profiler.stage("input"):
+            if self.gui_config.I_noise_reduce:
+                self.input_wav_denoise.roll(self.block_frame)
+                input_wav = self.input_wav.view()
+                input_wav = self.input_tg(
+                    input_wav[-self.sola_buffer_frame - self.block_frame :][None],
+                    input_wav[None],
+                ).squeeze(0)
+                input_wav[: self.sola_buffer_frame] *= self.fade_in_window
+                input_wav[: self.sola_buffer_frame] += (
+                    self.nr_buffer * self.fade_out_window
+                )
+                self.input_wav_denoise.view()[-self.block_frame :] = input_wav[
+                    : self.block_frame
+                ]
+                self.nr_buffer[:] = input_wav[self.block_frame :]
+                self.input_wav_res.push(
+                    self.resampler.stream(
+                        self.input_wav_denoise.view()[-self.block_frame :]
+                    )
+                )
+            else:
+                self.input_wav_res.push(
+                    self.resampler.stream(self.input_wav.view()[-self.block_frame :])
+                )
+        self.seq += 1
+        if self.gui_config.I_noise_reduce:
+            input_wav = self.input_wav_denoise.view()[self.extra_frame :]
+        else:
+            input_wav = self.input_wav.view()[self.extra_frame :]
+        block = {
+            "seq": self.seq,
+            "function": self.function,
+            "input_wav": input_wav,
+            "input_wav_res": self.input_wav_res.view(),
+        }
+        if copy:
+            block["input_wav"] = input_wav.clone()
+            block["input_wav_res"] = block["input_wav_res"].clone()
+        return block
+
+    def infer(self, block: dict, profiler=null_profiler) -> torch.Tensor:
+        """
+        模型推理, 输出为模型采样率重采样到 samplerate 后的音频
+        """
+        if block["seq"] != self.infer_seq + 1:
+            # 中间有块被丢弃, 按块前移的 f0 与特征缓存已不连续
+            self.rvc.reset_cache()
+        self.infer_seq = block["seq"]
+        if block["function"] == "vc":
+            infer_wav = self.rvc.infer(
+                block["input_wav_res"],
+                self.block_frame_16k,
+                self.skip_head,
+                self.return_length,
+                self.gui_config.f0method,
+                profiler=profiler,
+            )
+            if self.resampler2 is not None:
+                with profiler.stage("resample"):
+                    infer_wav = self.resampler2(infer_wav)
+        else:
+            infer_wav = block["input_wav"].clone()
+        return infer_wav
+
+    def postprocess(
+        self, block: dict, infer_wav: torch.Tensor, profiler=null_profiler
+    ) -> np.ndarray:
+        """
+        输出降噪, 响度混合与 SOLA 拼接
+        """
+        if block["seq"] != self.post_seq + 1:
+            # 中间有块被丢弃, SOLA 缓存的上一块尾部来自另一时刻, 改为从静音淡入
+            self.sola.reset()
+        self.post_seq = block["seq"]
+        # output noise reduction
+        if self.gui_config.O_noise_reduce and block["function"] == "vc":
+            with profiler.stage("output_nr"):
+                self.output_buffer.push(infer_wav[-self.block_frame :])
+                infer_wav = self.output_tg(
+                    infer_wav.unsqueeze(0), self.output_buffer.view().unsqueeze(0)
+                ).squeeze(0)
+        # volume envelop mixing
+        if self.gui_config.rms_mix_rate < 1 and block["function"] == "vc":
+            with profiler.stage("rms"):
+                self.rms_mixer(
+                    block["input_wav"], infer_wav, self.gui_config.rms_mix_rate
+                )
+        with profiler.stage("sola"):
+            infer_wav = self.sola.process(
+                infer_wav, self.block_frame, self.gui_config.use_pv
+            )
+        return (
+            infer_wav[: self.block_frame]
+            .repeat(self.gui_config.channels, 1)
+            .t()
+            .cpu()
+            .numpy()
+        )
@@ -0,0 +1,125 @@
+import queue
+import threading
+from time import perf_counter
+from typing import Callable, Optional, Union
+
+import numpy as np
+import torch
+
+from infer.lib.rtengine import RealtimeEngine
+
+DROP_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class PipelinedEngine(object):
+    """
+    把 RealtimeEngine 的 preprocess (门限, 降噪, 重采样), infer (模型推理) 与
+    postprocess (响度混合, SOLA) 放在三个线程中, 由有界队列连接, 使相邻块的
+    各阶段重叠执行.
+
+    队列满时按 policy 处理:
+        "block": 阻塞上游 (背压), 不丢块, 延迟随积压增长
+        "drop_oldest": 丢弃队列中最旧的块, 延迟不累积
+        "drop_newest": 丢弃新到的块
+    丢块后 engine.infer 会清空按块前移的 f0 与特征缓存, engine.postprocess
+    会重置 SOLA 的交叉淡化缓冲.
+
+    某一阶段出错时流水线停止, 异常记录在 self.error 并在该阶段的线程中
+    调用 on_error; put 与 get 不抛出异常, 以免终止调用方的音频线程
+    """
+
+    def __init__(
+        self,
+        engine: RealtimeEngine,
+        queue_size: int = 1,
+        policy: str = "drop_oldest",
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ):
+        if policy not in DROP_POLICIES:
+            raise ValueError("policy must be one of %s" % (DROP_POLICIES,))
+        self.engine = engine
+        self.policy = policy
+        self.dropped = 0
+        self.latency = 0.0  # 最近一块从 put 到可取出的时间 (秒)
+        self.error: Optional[BaseException] = None
+        self.on_error = on_error
+        self.stop_evt = threading.Event()
+        self.queues = [queue.Queue(max(queue_size, 1)) for _ in range(4)]
+        self.threads = [
+            threading.Thread(target=self._run, args=(i, stage), daemon=True)
+            for i, stage in enumerate(
+                (self._preprocess, self._infer, self._postprocess)
+            )
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _preprocess(self, item):
+        t0, indata = item
+        return t0, self.engine.preprocess(indata)
+
+    def _infer(self, item):
+        t0, block = item
+        return t0, block, self.engine.infer(block)
+
+    def _postprocess(self, item):
+        t0, block, infer_wav = item
+        return t0, self.engine.postprocess(block, infer_wav)
+
+    def _put(self, q: queue.Queue, item):
+        while not self.stop_evt.is_set():
+            try:
+                if self.policy == "block":
+                    q.put(item, timeout=0.1)
+                else:
+                    q.put_nowait(item)
+                return
+            except queue.Full:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return
+                if self.policy == "drop_oldest":
+                    try:
+                        q.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def _run(self, i: int, stage):
+        while not self.stop_evt.is_set():
+            try:
+                item = self.queues[i].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                with torch.no_grad():
+                    result = stage(item)
+            except BaseException as e:
+                self.error = e
+                self.stop_evt.set()
+                if self.on_error is not None:
+                    self.on_error(e)
+                return
+            self._put(self.queues[i + 1], result)
+
+    def put(self, indata: Union[np.ndarray, torch.Tensor]):
+        """
+        提交一块输入, 队列满时按 policy 处理, 已停止时丢弃
+        """
+        self._put(self.queues[0], (perf_counter(), indata))
+
+    def get(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        取出下一块输出, 超时或已停止时返回 None
+        """
+        try:
+            t0, outdata = self.queues[-1].get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.latency = perf_counter() - t0
+        return outdata
+
+    def stop(self):
+        self.stop_evt.set()
+        for thread in self.threads:
+            thread.join()
@@ -8,14 +8,16 @@ from typing import Union, Literal, Optional
 from pathlib import Path
 
 import fairseq
-import faiss
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torchaudio.transforms import Resample
 
+from infer.lib.ringbuffer import RingBuffer
 from rvc.f0 import Generator
+from rvc.index import load_index, load_torch_index
+from rvc.profiler import null_profiler
+from rvc.resample import resample
 from rvc.synthesizer import load_synthesizer
 from rvc.utils import FileLike
 
@@ -33,6 +35,8 @@ class RVC:
         use_jit: bool = False,
         is_half: bool = False,
         is_dml: bool = False,
+        index_on_device: bool = False,
+        incremental_hubert: bool = False,
     ) -> None:
         if is_dml:
 
@@ -55,24 +59,32 @@ class RVC:
         self.n_cpu = n_cpu
         self.use_jit = use_jit
         self.is_half = is_half
-
-        if index_rate > 0:
-            self.index = faiss.read_index(index_path)
-            self.big_npy = self.index.reconstruct_n(0, self.index.ntotal)
+        self.index_on_device = index_on_device
+        # 增量提取特征: 只对新音频及前 hubert_context 点重新提取,
+        # 上一块末尾 feats_margin 帧缺少右侧上下文, 一并重算
+        self.incremental_hubert = incremental_hubert
+        self.hubert_context = self.sr
+        self.feats_margin = 10
+        self.cache_feats: Optional[RingBuffer] = None
+        self.cache_feats0: Optional[RingBuffer] = None
 
         self.pth_path = pth_path
         self.index_path = index_path
         self.index_rate = index_rate
 
-        self.cache_pitch: torch.Tensor = torch.zeros(
-            1024, device=self.device, dtype=torch.long
-        )
-        self.cache_pitchf = torch.zeros(1024, device=self.device, dtype=torch.float32)
+        if index_rate > 0:
+            self._load_index()
 
-        self.resample_kernel = {}
+        self.cache_pitch = RingBuffer(1024, device=self.device, dtype=torch.long)
+        self.cache_pitchf = RingBuffer(1024, device=self.device, dtype=torch.float32)
 
         self.f0_gen = Generator(
-            Path(os.environ["rmvpe_root"]), is_half, 0, device, self.window, self.sr
+            Path(os.environ["rmvpe_root"]),
+            is_half,
+            0,
+            device,
+            self.window,
+            self.sr,
         )
 
         models, _, _ = fairseq.checkpoint_utils.load_model_ensemble_and_task(
@@ -131,9 +143,32 @@ class RVC:
 
     def set_index_rate(self, new_index_rate):
         if new_index_rate > 0 and self.index_rate <= 0:
-            self.index = faiss.read_index(self.index_path)
-            self.big_npy = self.index.reconstruct_n(0, self.index.ntotal)
+            self._load_index()
         self.index_rate = new_index_rate
+        self.cache_feats = None
+
+    def reset_cache(self):
+        """
+        输入不连续 (如实时流程丢弃了若干块) 时清空按块前移的缓存
+        """
+        self.cache_pitch.clear()
+        self.cache_pitchf.clear()
+        self.cache_feats = None
+
+    def close(self):
+        """
+        关闭 f0_gen 的进程池
+        """
+        self.f0_gen.close()
+
+    def _load_index(self):
+        self.index, self.big_npy = load_index(self.index_path)
+        # 显存不足时为 None, 回退到 faiss
+        self.torch_index = (
+            load_torch_index(self.index_path, self.device, self.is_half)
+            if self.index_on_device
+            else None
+        )
 
     def infer(
         self,
@@ -143,54 +178,35 @@ class RVC:
         return_length: int,
         f0method: Union[tuple, str],
         protect: float = 1.0,
+        profiler=null_profiler,
     ) -> np.ndarray:
-        with torch.no_grad():
-            if self.is_half:
-                feats = input_wav.half()
-            else:
-                feats = input_wav.float()
-            feats = feats.to(self.device)
-            if feats.dim() == 2:  # double channels
-                feats = feats.mean(-1)
-            feats = feats.view(1, -1)
-            padding_mask = torch.BoolTensor(feats.shape).to(self.device).fill_(False)
-
-            inputs = {
-                "source": feats,
-                "padding_mask": padding_mask,
-                "output_layer": 9 if self.version == "v1" else 12,
-            }
-            logits = self.hubert.extract_features(**inputs)
-            feats = (
-                self.hubert.final_proj(logits[0]) if self.version == "v1" else logits[0]
+        p_len = input_wav.shape[0] // self.window
+        keep_feats0 = protect < 0.5 and self.if_f0 == 1
+        if self.incremental_hubert:
+            with profiler.stage("hubert", audio=input_wav) as sizes:
+                feats, feats0 = self._get_feats_incremental(
+                    input_wav, block_frame_16k, p_len
+                )
+                sizes["feats"] = feats
+        else:
+            with profiler.stage("hubert", audio=input_wav) as sizes, torch.no_grad():
+                feats = self._extract_features(input_wav)
+                sizes["feats"] = feats
+            feats0 = feats.clone() if keep_feats0 else None
+            with profiler.stage("index", feats=feats):
+                feats[0][skip_head // 2 :] = self._blend_index(
+                    feats[0][skip_head // 2 :]
+                )
+            feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(
+                0, 2, 1
             )
-            feats = torch.cat((feats, feats[:, -1:, :]), 1)
-            if protect < 0.5 and self.if_f0 == 1:
-                feats0 = feats.clone()
-
-        try:
-            if hasattr(self, "index") and self.index_rate > 0:
-                npy = feats[0][skip_head // 2 :].cpu().numpy()
-                if self.is_half:
-                    npy = npy.astype("float32")
-                score, ix = self.index.search(npy, k=8)
-                if (ix >= 0).all():
-                    weight = np.square(1 / score)
-                    weight /= weight.sum(axis=1, keepdims=True)
-                    npy = np.sum(
-                        self.big_npy[ix] * np.expand_dims(weight, axis=2), axis=1
-                    )
-                    if self.is_half:
-                        npy = npy.astype("float16")
-                    feats[0][skip_head // 2 :] = (
-                        torch.from_numpy(npy).unsqueeze(0).to(self.device)
-                        * self.index_rate
-                        + (1 - self.index_rate) * feats[0][skip_head // 2 :]
-                    )
-        except:
-            pass
+            feats = feats[:, :p_len, :]
+            if feats0 is not None:
+                feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(
+                    0, 2, 1
+                )
+                feats0 = feats0[:, :p_len, :]
 
-        p_len = input_wav.shape[0] // self.window
         factor = pow(2, self.formant_shift / 12)
         return_length2 = int(np.ceil(return_length * factor))
         cache_pitch = cache_pitchf = None
@@ -205,28 +221,24 @@ class RVC:
                 f0_extractor_frame = (
                     5120 * ((f0_extractor_frame - 1) // 5120 + 1) - self.window
                 )
-            pitch, pitchf = self._get_f0(
-                input_wav[-f0_extractor_frame:],
-                self.f0_up_key - self.formant_shift,
-                method=f0method,
-            )
+            with profiler.stage("f0", audio=input_wav[-f0_extractor_frame:]) as sizes:
+                pitch, pitchf = self._get_f0(
+                    input_wav[-f0_extractor_frame:],
+                    self.f0_up_key - self.formant_shift,
+                    method=f0method,
+                )
+                sizes["f0"] = pitchf
             shift = block_frame_16k // self.window
-            self.cache_pitch[:-shift] = self.cache_pitch[shift:].clone()
-            self.cache_pitchf[:-shift] = self.cache_pitchf[shift:].clone()
-            self.cache_pitch[4 - pitch.shape[0] :] = pitch[3:-1]
-            self.cache_pitchf[4 - pitch.shape[0] :] = pitchf[3:-1]
-            cache_pitch = self.cache_pitch[None, -p_len:]
+            self.cache_pitch.roll(shift)
+            self.cache_pitchf.roll(shift)
+            self.cache_pitch.view()[4 - pitch.shape[0] :] = pitch[3:-1]
+            self.cache_pitchf.view()[4 - pitch.shape[0] :] = pitchf[3:-1]
+            cache_pitch = self.cache_pitch.view()[None, -p_len:]
             cache_pitchf = (
-                self.cache_pitchf[None, -p_len:] * return_length2 / return_length
+                self.cache_pitchf.view()[None, -p_len:] * return_length2 / return_length
             )
 
-        feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
-        feats = feats[:, :p_len, :]
-        if protect < 0.5 and pitch is not None and pitchf is not None:
-            feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(
-                0, 2, 1
-            )
-            feats0 = feats0[:, :p_len, :]
+        if keep_feats0 and pitch is not None and pitchf is not None:
             pitchff = pitchf.clone()
             pitchff[pitchf > 0] = 1
             pitchff[pitchf < 1] = protect
@@ -235,7 +247,7 @@ class RVC:
             feats = feats.to(feats0.dtype)
         p_len = torch.LongTensor([p_len]).to(self.device)
         sid = torch.LongTensor([0]).to(self.device)
-        with torch.no_grad():
+        with profiler.stage("synth", feats=feats) as sizes, torch.no_grad():
             infered_audio = (
                 self.net_g.infer(
                     feats,
@@ -250,19 +262,100 @@ class RVC:
                 .squeeze(1)
                 .float()
             )
+            sizes["audio"] = infered_audio
         upp_res = int(np.floor(factor * self.tgt_sr // 100))
         if upp_res != self.tgt_sr // 100:
-            if upp_res not in self.resample_kernel:
-                self.resample_kernel[upp_res] = Resample(
-                    orig_freq=upp_res,
-                    new_freq=self.tgt_sr // 100,
-                    dtype=torch.float32,
-                ).to(self.device)
-            infered_audio = self.resample_kernel[upp_res](
-                infered_audio[:, : return_length * upp_res]
+            infered_audio = resample(
+                infered_audio[:, : return_length * upp_res],
+                upp_res,
+                self.tgt_sr // 100,
+                self.device,
             )
         return infered_audio.squeeze()
 
+    def _extract_features(self, input_wav: torch.Tensor) -> torch.Tensor:
+        if self.is_half:
+            feats = input_wav.half()
+        else:
+            feats = input_wav.float()
+        feats = feats.to(self.device)
+        if feats.dim() == 2:  # double channels
+            feats = feats.mean(-1)
+        feats = feats.view(1, -1)
+        padding_mask = torch.BoolTensor(feats.shape).to(self.device).fill_(False)
+
+        inputs = {
+            "source": feats,
+            "padding_mask": padding_mask,
+            "output_layer": 9 if self.version == "v1" else 12,
+        }
+        logits = self.hubert.extract_features(**inputs)
+        feats = self.hubert.final_proj(logits[0]) if self.version == "v1" else logits[0]
+        return torch.cat((feats, feats[:, -1:, :]), 1)
+
+    def _blend_index(self, feats: torch.Tensor) -> torch.Tensor:
+        try:
+            if getattr(self, "torch_index", None) is not None and self.index_rate > 0:
+                return self.torch_index.blend(feats, self.index_rate)
+            elif hasattr(self, "index") and self.index_rate > 0:
+                npy = feats.cpu().numpy()
+                if self.is_half:
+                    npy = npy.astype("float32")
+                score, ix = self.index.search(npy, k=8)
+                if (ix >= 0).all():
+                    weight = np.square(1 / score)
+                    weight /= weight.sum(axis=1, keepdims=True)
+                    npy = np.sum(
+                        self.big_npy[ix] * np.expand_dims(weight, axis=2), axis=1
+                    )
+                    if self.is_half:
+                        npy = npy.astype("float16")
+                    return (
+                        torch.from_numpy(npy).to(self.device) * self.index_rate
+                        + (1 - self.index_rate) * feats
+                    )
+        except:
+            pass
+        return feats
+
+    def _get_feats_incremental(
+        self, input_wav: torch.Tensor, block_frame_16k: int, p_len: int
+    ):
+        """
+        缓存上一块 2 倍插值后的特征 (混合索引前后各一份), 按块平移后只替换末尾
+        新音频对应的帧. transformer 与首层 GroupNorm 只能看到截断后的上下文,
+        因此结果是对整窗提取的近似, 误差集中在 skip_head 之前仅作上下文的部分
+        """
+        shift = block_frame_16k // self.window
+        n_new = min(shift + self.feats_margin, p_len)
+        if self.cache_feats is None or len(self.cache_feats) != p_len or n_new == p_len:
+            start, n_new = 0, p_len  # 首块或缓冲长度改变时整窗提取
+        else:
+            # 起点对齐到 hubert 的 320 点帧, 使新帧与整窗提取的帧位置一致
+            start = input_wav.shape[0] - n_new * self.window - self.hubert_context
+            start = max(start, 0) // (2 * self.window) * (2 * self.window)
+        offset = start // self.window
+        with torch.no_grad():
+            feats0 = self._extract_features(input_wav[start:])
+            feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(
+                0, 2, 1
+            )
+            feats0 = feats0[0, p_len - n_new - offset : p_len - offset]
+            feats = self._blend_index(feats0)
+        if n_new == p_len:
+            self.cache_feats0 = RingBuffer(
+                p_len, feats0.shape[1:], device=self.device, dtype=feats0.dtype
+            )
+            self.cache_feats = RingBuffer(
+                p_len, feats.shape[1:], device=self.device, dtype=feats.dtype
+            )
+        else:
+            self.cache_feats0.roll(shift)
+            self.cache_feats.roll(shift)
+        self.cache_feats0.view()[-n_new:] = feats0
+        self.cache_feats.view()[-n_new:] = feats
+        return self.cache_feats.view()[None], self.cache_feats0.view()[None]
+
     def _get_f0(
         self,
         x: torch.Tensor,
@@ -0,0 +1,123 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def phase_vocoder(a, b, fade_out, fade_in):
+    window = torch.sqrt(fade_out * fade_in)
+    fa = torch.fft.rfft(a * window)
+    fb = torch.fft.rfft(b * window)
+    absab = torch.abs(fa) + torch.abs(fb)
+    n = a.shape[0]
+    if n % 2 == 0:
+        absab[1:-1] *= 2
+    else:
+        absab[1:] *= 2
+    phia = torch.angle(fa)
+    phib = torch.angle(fb)
+    deltaphase = phib - phia
+    deltaphase = deltaphase - 2 * np.pi * torch.floor(deltaphase / 2 / np.pi + 0.5)
+    w = 2 * np.pi * torch.arange(n // 2 + 1).to(a) + deltaphase
+    t = torch.arange(n).unsqueeze(-1).to(a) / n
+    result = (
+        a * (fade_out**2)
+        + b * (fade_in**2)
+        + torch.sum(absab * torch.cos(w * t + phia), -1) * window / n
+    )
+    return result
+
+
+def sola_search(
+    x: torch.Tensor, ref: torch.Tensor, energy: torch.Tensor, nfft: int = 0
+) -> int:
+    """
+    返回 x 中与 ref 归一化互相关最大的偏移. x 长度为 len(ref) + 搜索长度,
+    energy 为长度 len(x) + 1 的预分配缓冲, energy[0] 须为 0.
+    滑窗能量由一次前缀和得到, 代替对 x**2 与全 1 卷积核再做一次卷积;
+    nfft > 0 时互相关经 FFT 计算, 耗时几乎不随搜索长度增长
+    """
+    n = ref.shape[0]
+    if nfft > 0:
+        cor_nom = torch.fft.irfft(
+            torch.fft.rfft(x, nfft) * torch.fft.rfft(ref, nfft).conj(), nfft
+        )[: x.shape[0] - n + 1]
+    else:
+        cor_nom = F.conv1d(x[None, None], ref[None, None])[0, 0]
+    torch.cumsum((x * x).to(energy.dtype), 0, out=energy[1:])
+    cor_den = torch.sqrt((energy[n:] - energy[:-n]).clamp_(min=0).to(x.dtype) + 1e-8)
+    return int(torch.argmax(cor_nom / cor_den).item())
+
+
+class SOLA(object):
+    """
+    SOLA 拼接 (算法来自 https://github.com/yxlllc/DDSP-SVC): 在搜索范围内找与
+    上一块尾部最相似的位置, 再与之交叉淡化. 窗口与缓冲均在初始化时分配
+    """
+
+    def __init__(self, buffer_frame: int, search_frame: int, device, jit=False):
+        self.buffer_frame = buffer_frame
+        self.search_frame = search_frame
+        self.device = torch.device(device)
+        self.buffer = torch.zeros(buffer_frame, device=device, dtype=torch.float32)
+        self.fade_in_window: torch.Tensor = (
+            torch.sin(
+                0.5
+                * np.pi
+                * torch.linspace(
+                    0.0, 1.0, steps=buffer_frame, device=device, dtype=torch.float32
+                )
+            )
+            ** 2
+        )
+        self.fade_out_window: torch.Tensor = 1 - self.fade_in_window
+        # 前缀和在 float32 下相减会损失安静片段的精度, 支持时使用 float64
+        self.energy = torch.zeros(
+            buffer_frame + search_frame + 1,
+            device=device,
+            dtype=(
+                torch.float64 if self.device.type in ("cpu", "cuda") else torch.float32
+            ),
+        )
+        # 搜索范围较大时直接卷积的开销为 buffer_frame * search_frame, 改用 FFT;
+        # 默认参数 (search_frame 为 10ms) 下仍直接卷积, 结果与原实现一致
+        self.nfft = 0
+        if search_frame >= buffer_frame // 2 and self.device.type != "privateuseone":
+            self.nfft = 1 << (buffer_frame + search_frame - 1).bit_length()
+        self.search_fn = sola_search
+        if jit:
+            try:
+                self.search_fn = torch.jit.script(sola_search)
+            except Exception:
+                pass
+
+    def reset(self):
+        self.buffer.zero_()
+
+    def search(self, infer_wav: torch.Tensor) -> int:
+        return self.search_fn(
+            infer_wav[: self.buffer_frame + self.search_frame],
+            self.buffer,
+            self.energy,
+            self.nfft,
+        )
+
+    def process(
+        self, infer_wav: torch.Tensor, block_frame: int, use_pv=False
+    ) -> torch.Tensor:
+        """
+        对齐并交叉淡化, 返回从对齐位置开始的 infer_wav 视图 (前 block_frame 点为输出),
+        并把其后 buffer_frame 点保存为下一块的参考
+        """
+        infer_wav = infer_wav[self.search(infer_wav) :]
+        if use_pv and "privateuseone" not in str(self.device):
+            infer_wav[: self.buffer_frame] = phase_vocoder(
+                self.buffer,
+                infer_wav[: self.buffer_frame],
+                self.fade_out_window,
+                self.fade_in_window,
+            )
+        else:
+            infer_wav[: self.buffer_frame] *= self.fade_in_window
+            infer_wav[: self.buffer_frame] += self.buffer * self.fade_out_window
+        self.buffer[:] = infer_wav[block_frame : block_frame + self.buffer_frame]
+        return infer_wav
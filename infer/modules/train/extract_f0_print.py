@@ -59,37 +59,65 @@ class FeatureInput(object):
             samplerate,
         )
 
-    def go(self, paths, f0_method):
+    def go(self, paths, f0_method, batch_size=64):
         if len(paths) == 0:
             printt("no-f0-todo")
         else:
             printt("todo-f0-%s" % len(paths))
             n = max(len(paths) // 5, 1)  # 每个进程最多打印5条
-            for idx, (inp_path, opt_path1, opt_path2) in enumerate(paths):
+            # 每次读入 batch_size 个文件, 由 calculate_batch 按长度分组批量推理
+            for start in range(0, len(paths), batch_size):
+                todo = []
+                for idx in range(start, min(start + batch_size, len(paths))):
+                    inp_path, opt_path1, opt_path2 = paths[idx]
+                    try:
+                        if idx % n == 0:
+                            printt(
+                                "f0ing,now-%s,all-%s,-%s" % (idx, len(paths), inp_path)
+                            )
+                        if (
+                            os.path.exists(opt_path1 + ".npy") == True
+                            and os.path.exists(opt_path2 + ".npy") == True
+                        ):
+                            continue
+                        todo.append((idx, paths[idx], load_audio(inp_path, self.fs)))
+                    except:
+                        printt(
+                            "f0fail-%s-%s-%s" % (idx, inp_path, traceback.format_exc())
+                        )
+                if len(todo) == 0:
+                    continue
+                xs = [x for _, _, x in todo]
                 try:
-                    if idx % n == 0:
-                        printt("f0ing,now-%s,all-%s,-%s" % (idx, len(paths), inp_path))
-                    if (
-                        os.path.exists(opt_path1 + ".npy") == True
-                        and os.path.exists(opt_path2 + ".npy") == True
-                    ):
-                        continue
-                    x = load_audio(inp_path, self.fs)
-                    coarse_pit, feature_pit = self.f0_gen.calculate(
-                        x, x.shape[0] // self.hop, 0, f0_method, None
+                    results = self.f0_gen.calculate_batch(
+                        xs, [x.shape[0] // self.hop for x in xs], 0, f0_method, None
                     )
-                    np.save(
-                        opt_path2,
-                        feature_pit,
-                        allow_pickle=False,
-                    )  # nsf
-                    np.save(
-                        opt_path1,
-                        coarse_pit,
-                        allow_pickle=False,
-                    )  # ori
                 except:
-                    printt("f0fail-%s-%s-%s" % (idx, inp_path, traceback.format_exc()))
+                    # 批量计算失败时逐个计算, 以定位出错的文件
+                    results = [None] * len(todo)
+                for (idx, (inp_path, opt_path1, opt_path2), x), result in zip(
+                    todo, results
+                ):
+                    try:
+                        if result is None:
+                            result = self.f0_gen.calculate(
+                                x, x.shape[0] // self.hop, 0, f0_method, None
+                            )
+                        coarse_pit, feature_pit = result
+                        np.save(
+                            opt_path2,
+                            feature_pit,
+                            allow_pickle=False,
+                        )  # nsf
+                        np.save(
+                            opt_path1,
+                            coarse_pit,
+                            allow_pickle=False,
+                        )  # ori
+                    except:
+                        printt(
+                            "f0fail-%s-%s-%s" % (idx, inp_path, traceback.format_exc())
+                        )
 
 
 if __name__ == "__main__":
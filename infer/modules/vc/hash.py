@@ -103,7 +103,7 @@ def model_hash(config, tgt_sr, net_g, if_f0, version):
         net_g,
         0,
         audio,
-        [0, 0, 0],
+        [0, 0, 0, 0],
         6,
         original_rmvpe_f0(),
         "",
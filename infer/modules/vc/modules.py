@@ -6,10 +6,20 @@ logger = logging.getLogger(__name__)
 
 import numpy as np
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from pathlib import Path
 
-from infer.lib.audio import load_audio, wav2, save_audio, float_np_array_to_wav_buf
-from rvc.synthesizer import get_synthesizer, load_synthesizer
+from infer.lib.audio import (
+    load_audio,
+    load_audio_blocks,
+    wav2,
+    save_audio,
+    float_np_array_to_wav_buf,
+)
+from rvc.f0 import Generator
+from rvc.profiler import null_profiler
+from rvc.synthesizer import SynthesizerPool
 from .info import show_model_info
 from .pipeline import Pipeline
 from .utils import get_index_path_from_model, load_hubert
@@ -28,6 +38,28 @@ class VC:
         self.hubert_model = None
 
         self.config = config
+        # 多个音色常驻, 共享同一个 hubert 与 f0 模型
+        self.pool = SynthesizerPool(
+            config.device,
+            config.is_half,
+            int(os.getenv("model_pool_bytes", 1 << 30)),
+        )
+        self.f0_gen = None
+        self.f0_executor = ThreadPoolExecutor(max_workers=1)
+        self.pipelines = {}  # tgt_sr -> Pipeline
+
+    def close(self):
+        """
+        关闭各 Pipeline 与共享的 f0_gen, f0_executor 持有的线程和进程池
+        """
+        for pipeline in self.pipelines.values():
+            pipeline.close()
+        self.pipelines.clear()
+        self.pipeline = None
+        if self.f0_gen is not None:
+            self.f0_gen.close()
+            self.f0_gen = None
+        self.f0_executor.shutdown()
 
     def get_vc(self, sid, *to_return_protect):
         logger.info("Get sid: " + sid)
@@ -52,19 +84,9 @@ class VC:
                 self.hubert_model is not None
             ):  # 考虑到轮询, 需要加个判断看是否 sid 是由有模型切换到无模型的
                 logger.info("Clean model cache")
-                del (self.net_g, self.n_spk, self.hubert_model, self.tgt_sr)  # ,cpt
-                self.hubert_model = self.net_g = self.n_spk = self.hubert_model = (
-                    self.tgt_sr
-                ) = None
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                elif torch.backends.mps.is_available():
-                    torch.mps.empty_cache()
-                ###楼下不这么折腾清理不干净
-                self.net_g, self.cpt = get_synthesizer(self.cpt, self.config.device)
-                self.if_f0 = self.cpt.get("f0", 1)
-                self.version = self.cpt.get("version", "v1")
-                del self.net_g, self.cpt
+                self.hubert_model = self.net_g = self.n_spk = self.tgt_sr = None
+                self.cpt = self.pipeline = None
+                self.pool.clear()
                 if torch.cuda.is_available():
                     torch.cuda.empty_cache()
                 elif torch.backends.mps.is_available():
@@ -85,17 +107,26 @@ class VC:
         person = f'{os.getenv("weight_root")}/{sid}'
         logger.info(f"Loading: {person}")
 
-        self.net_g, self.cpt = load_synthesizer(person, self.config.device)
+        self.net_g, self.cpt = self.pool.load(person)
         self.tgt_sr = self.cpt["config"][-1]
-        self.cpt["config"][-3] = self.cpt["weight"]["emb_g.weight"].shape[0]  # n_spk
         self.if_f0 = self.cpt.get("f0", 1)
         self.version = self.cpt.get("version", "v1")
 
-        if self.config.is_half:
-            self.net_g = self.net_g.half()
-        else:
-            self.net_g = self.net_g.float()
-        self.pipeline = Pipeline(self.tgt_sr, self.config)
+        if self.f0_gen is None:
+            self.f0_gen = Generator(
+                Path(os.environ["rmvpe_root"]),
+                self.config.is_half,
+                self.config.x_pad,
+                self.config.device,
+                rmvpe_chunk_frames=self.config.rmvpe_chunk_frames,
+                n_cpu=self.config.f0_n_cpu,
+                rmvpe_chunk_batch=self.config.rmvpe_chunk_batch,
+            )
+        if self.tgt_sr not in self.pipelines:
+            self.pipelines[self.tgt_sr] = Pipeline(
+                self.tgt_sr, self.config, self.f0_gen, self.f0_executor
+            )
+        self.pipeline = self.pipelines[self.tgt_sr]
 
         n_spk = self.cpt["config"][-3]
         index = {"value": get_index_path_from_model(sid), "__type__": "update"}
@@ -128,18 +159,25 @@ class VC:
         resample_sr,
         rms_mix_rate,
         protect,
+        batch_size=1,
+        profiler=null_profiler,
     ):
+        """
+        传入 rvc.profiler.Profiler 可记录各阶段耗时, 峰值显存与张量尺寸
+        """
         if input_audio_path is None:
             return "You need to upload an audio", None
         elif hasattr(input_audio_path, "name"):
             input_audio_path = str(input_audio_path.name)
         f0_up_key = int(f0_up_key)
         try:
-            audio = load_audio(input_audio_path, 16000)
+            with profiler.stage("load") as sizes:
+                audio = load_audio(input_audio_path, 16000)
+                sizes["audio"] = audio
             audio_max = np.abs(audio).max() / 0.95
             if audio_max > 1:
                 np.divide(audio, audio_max, audio)
-            times = [0, 0, 0]
+            times = [0, 0, 0, 0]
 
             if self.hubert_model is None:
                 self.hubert_model = load_hubert(self.config.device, self.config.is_half)
@@ -178,6 +216,8 @@ class VC:
                 self.version,
                 protect,
                 f0_file,
+                batch_size,
+                profiler,
             ).astype(np.int16)
             if self.tgt_sr != resample_sr >= 16000:
                 tgt_sr = resample_sr
@@ -189,7 +229,7 @@ class VC:
                 else "Index not used."
             )
             return (
-                "Success.\n%s\nTime: npy: %.2fs, f0: %.2fs, infer: %.2fs."
+                "Success.\n%s\nTime: npy: %.2fs, f0: %.2fs, infer: %.2fs, overlap: %.2fs."
                 % (index_info, *times),
                 (tgt_sr, audio_opt),
             )
@@ -198,6 +238,53 @@ class VC:
             logger.warning(info)
             return str(e), None
 
+    def vc_stream(
+        self,
+        sid,
+        input_audio_path,
+        f0_up_key,
+        f0_method,
+        file_index,
+        index_rate,
+        filter_radius,
+        resample_sr,
+        rms_mix_rate,
+        protect,
+    ):
+        """
+        逐段产出 (采样率, int16 音频块), 内存占用不随输入时长增长,
+        可直接写入编码器
+        """
+        if self.hubert_model is None:
+            self.hubert_model = load_hubert(self.config.device, self.config.is_half)
+        if self.tgt_sr != resample_sr >= 16000:
+            tgt_sr = resample_sr
+        else:
+            tgt_sr = self.tgt_sr
+        times = [0, 0, 0, 0]
+        for audio_opt in self.pipeline.stream(
+            self.hubert_model,
+            self.net_g,
+            sid,
+            load_audio_blocks(input_audio_path, 16000, 16000),
+            times,
+            int(f0_up_key),
+            f0_method,
+            file_index or "",
+            index_rate,
+            self.if_f0,
+            filter_radius,
+            self.tgt_sr,
+            resample_sr,
+            rms_mix_rate,
+            self.version,
+            protect,
+        ):
+            yield tgt_sr, audio_opt
+        logger.info(
+            "Time: npy: %.2fs, f0: %.2fs, infer: %.2fs, overlap: %.2fs." % tuple(times)
+        )
+
     def vc_multi(
         self,
         sid,
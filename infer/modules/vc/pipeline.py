@@ -5,17 +5,19 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from time import time
 
-import faiss
-import librosa
 import numpy as np
 import torch
 import torch.nn.functional as F
 from scipy import signal
 
 from rvc.f0 import Generator
+from rvc.index import TorchIndex, load_index, load_torch_index
+from rvc.profiler import null_profiler
+from rvc.resample import Resampler, resample
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
@@ -23,30 +25,69 @@ sys.path.append(now_dir)
 bh, ah = signal.butter(N=5, Wn=48, btype="high", fs=16000)
 
 
-def change_rms(data1, sr1, data2, sr2, rate):  # 1是输入音频，2是输出音频,rate是2的占比
-    # print(data1.max(),data2.max())
-    rms1 = librosa.feature.rms(
-        y=data1, frame_length=sr1 // 2 * 2, hop_length=sr1 // 2
-    )  # 每半秒一个点
-    rms2 = librosa.feature.rms(y=data2, frame_length=sr2 // 2 * 2, hop_length=sr2 // 2)
-    rms1 = torch.from_numpy(rms1)
-    rms1 = F.interpolate(
-        rms1.unsqueeze(0), size=data2.shape[0], mode="linear"
-    ).squeeze()
-    rms2 = torch.from_numpy(rms2)
-    rms2 = F.interpolate(
-        rms2.unsqueeze(0), size=data2.shape[0], mode="linear"
-    ).squeeze()
-    rms2 = torch.max(rms2, torch.zeros_like(rms2) + 1e-6)
-    data2 *= (
-        torch.pow(rms1, torch.tensor(1 - rate))
-        * torch.pow(rms2, torch.tensor(rate - 1))
-    ).numpy()
+def frame_rms(data, hop_length):
+    """
+    与 librosa.feature.rms(frame_length=2 * hop_length, center=True) 一致.
+    每帧恰好覆盖前后两个 hop, 先对 hop 求平方和再两两相加, 不产生整段拷贝
+    (einsum 按缓冲分块转换到 float64, 负步长的视图也不会被复制)
+    """
+    n_hop = data.shape[0] // hop_length
+    hop_sum = np.zeros(n_hop + 2)
+    hops = data[: n_hop * hop_length].reshape(n_hop, hop_length)
+    hop_sum[1 : n_hop + 1] = np.einsum("ij,ij->i", hops, hops, dtype=np.float64)
+    tail = data[n_hop * hop_length :]
+    hop_sum[n_hop + 1] = np.dot(tail, tail)
+    return np.sqrt((hop_sum[:-1] + hop_sum[1:]) / (2 * hop_length))
+
+
+def change_rms(
+    data1, sr1, data2, sr2, rate, chunk_size=1 << 16
+):  # 1是输入音频，2是输出音频,rate是2的占比
+    """
+    按每半秒一点的 rms 包络混合, 原地修改 data2. 与 F.interpolate(mode="linear")
+    相同地插值到输出采样点, 分块计算增益, 额外内存只与帧数和 chunk_size 有关.
+    data1 可以是 filtfilt 返回的负步长视图
+    """
+    rms1 = frame_rms(data1, sr1 // 2)
+    rms2 = np.maximum(frame_rms(data2, sr2 // 2), 1e-6)
+    n = data2.shape[0]
+    xp1 = np.arange(rms1.shape[0])
+    xp2 = np.arange(rms2.shape[0])
+    for start in range(0, n, chunk_size):
+        x = np.arange(start, min(start + chunk_size, n)) + 0.5
+        gain = np.power(np.interp(x * (rms1.shape[0] / n) - 0.5, xp1, rms1), 1 - rate)
+        gain *= np.power(np.interp(x * (rms2.shape[0] / n) - 0.5, xp2, rms2), rate - 1)
+        data2[start : start + x.shape[0]] *= gain
     return data2
 
 
+def get_opt_ts(audio_pad, window, t_center, t_query):
+    """
+    在每个 t_center 整数倍前后 t_query 范围内, 找 window 点绝对值和最小处作为切点.
+    audio_pad 为前后各 reflect 补 window // 2 点的音频
+    """
+    n = audio_pad.shape[0] - window // 2 * 2
+    ts = np.arange(t_center, n, t_center)
+    if ts.shape[0] == 0:
+        return []
+    # audio_sum[i] = |audio_pad[i : i + window]|.sum()
+    audio_cum = np.zeros(audio_pad.shape[0] + 1)
+    np.cumsum(np.abs(audio_pad), out=audio_cum[1:])
+    audio_sum = audio_cum[window : window + n] - audio_cum[:n]
+    # 末尾查询区间越界的部分补 inf, 使其不会被选中
+    tail = ts[-1] + t_query - n
+    if tail > 0:
+        audio_sum = np.pad(audio_sum, (0, tail), constant_values=np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(audio_sum, 2 * t_query)
+    return (ts - t_query + windows[ts - t_query].argmin(axis=1)).tolist()
+
+
 class Pipeline(object):
-    def __init__(self, tgt_sr, config):
+    def __init__(self, tgt_sr, config, f0_gen=None, f0_executor=None):
+        """
+        f0_gen 可在多个 Pipeline 间共享, 避免重复加载 rmvpe 等 f0 模型;
+        f0_executor 为计算 f0 的后台线程, 同样可以共享
+        """
         self.x_pad, self.x_query, self.x_center, self.x_max, self.is_half = (
             config.x_pad,
             config.x_query,
@@ -63,15 +104,31 @@ class Pipeline(object):
         self.t_center = self.sr * self.x_center  # 查询切点位置
         self.t_max = self.sr * self.x_max  # 免查询时长阈值
         self.device = config.device
+        self.index_on_device = getattr(config, "index_on_device", False)
 
-        self.f0_gen = Generator(
+        self.own_f0_gen = f0_gen is None
+        self.f0_gen = f0_gen or Generator(
             Path(os.environ["rmvpe_root"]),
             self.is_half,
             self.x_pad,
             self.device,
             self.window,
             self.sr,
+            rmvpe_chunk_frames=getattr(config, "rmvpe_chunk_frames", 0),
+            n_cpu=getattr(config, "f0_n_cpu", 1),
+            rmvpe_chunk_batch=getattr(config, "rmvpe_chunk_batch", 1),
         )
+        self.own_f0_executor = f0_executor is None
+        self.f0_executor = f0_executor or ThreadPoolExecutor(max_workers=1)
+
+    def close(self):
+        """
+        关闭自己创建的 f0 后台线程与 f0_gen 的进程池
+        """
+        if self.own_f0_executor:
+            self.f0_executor.shutdown()
+        if self.own_f0_gen:
+            self.f0_gen.close()
 
     def vc(
         self,
@@ -87,101 +144,235 @@ class Pipeline(object):
         index_rate,
         version,
         protect,
+        profiler=null_profiler,
     ):  # ,file_index,file_big_npy
-        feats = torch.from_numpy(audio0)
-        if self.is_half:
-            feats = feats.half()
-        else:
-            feats = feats.float()
-        if feats.dim() == 2:  # double channels
-            feats = feats.mean(-1)
-        assert feats.dim() == 1, feats.dim()
-        feats = feats.view(1, -1)
-        padding_mask = torch.BoolTensor(feats.shape).to(self.device).fill_(False)
+        return self.vc_batch(
+            model,
+            net_g,
+            sid,
+            [audio0],
+            [pitch],
+            [pitchf],
+            times,
+            index,
+            big_npy,
+            index_rate,
+            version,
+            protect,
+            profiler,
+        )[0]
+
+    def vc_batch(
+        self,
+        model,
+        net_g,
+        sid,
+        audios,
+        pitches,
+        pitchfs,
+        times,
+        index,
+        big_npy,
+        index_rate,
+        version,
+        protect,
+        profiler=null_profiler,
+    ):
+        """
+        将若干段补零到同一长度, 一次完成 hubert, 索引检索与 net_g.infer,
+        再按各段真实长度裁剪输出. 各段应长度相近 (pipeline 的切分即如此),
+        否则 hubert 首层 GroupNorm 的统计量会受补零影响而与逐段推理略有差异
+        """
+        feats, feats0, p_lens = self.extract_features(
+            model,
+            audios,
+            times,
+            index,
+            big_npy,
+            index_rate,
+            version,
+            protect < 0.5 and pitches[0] is not None and pitchfs[0] is not None,
+            profiler,
+        )
+        return self.synthesize(
+            net_g,
+            sid,
+            feats,
+            feats0,
+            p_lens,
+            pitches,
+            pitchfs,
+            times,
+            protect,
+            profiler,
+        )
+
+    def extract_features(
+        self,
+        model,
+        audios,
+        times,
+        index,
+        big_npy,
+        index_rate,
+        version,
+        keep_feats0,
+        profiler=null_profiler,
+    ):
+        """
+        返回 2 倍插值后的 (feats, feats0, p_lens), feats0 为未混合索引的特征,
+        keep_feats0 为假时为 None
+        """
+        n_seg = len(audios)
+        lengths = [audio0.shape[0] for audio0 in audios]
+        feats = torch.zeros(n_seg, max(lengths))
+        padding_mask = torch.ones(n_seg, max(lengths), dtype=torch.bool)
+        for i, audio0 in enumerate(audios):
+            audio0 = torch.from_numpy(audio0)
+            if audio0.dim() == 2:  # double channels
+                audio0 = audio0.mean(-1)
+            assert audio0.dim() == 1, audio0.dim()
+            feats[i, : lengths[i]] = audio0
+            padding_mask[i, : lengths[i]] = False
+        feats = feats.half() if self.is_half else feats.float()
+        n_frames = lengths
+        for conv_layer in model.feature_extractor.conv_layers:
+            conv = conv_layer[0]
+            n_frames = [
+                (n - conv.kernel_size[0]) // conv.stride[0] + 1 for n in n_frames
+            ]
 
         inputs = {
             "source": feats.to(self.device),
-            "padding_mask": padding_mask,
+            "padding_mask": padding_mask.to(self.device),
             "output_layer": 9 if version == "v1" else 12,
         }
         t0 = time()
-        with torch.no_grad():
-            logits = model.extract_features(**inputs)
-            feats = model.final_proj(logits[0]) if version == "v1" else logits[0]
-        if protect < 0.5 and pitch is not None and pitchf is not None:
-            feats0 = feats.clone()
+        with profiler.stage("hubert", source=inputs["source"]) as sizes:
+            with torch.no_grad():
+                logits = model.extract_features(**inputs)
+                feats = model.final_proj(logits[0]) if version == "v1" else logits[0]
+            sizes["feats"] = feats
+        feats0 = feats.clone() if keep_feats0 else None
         if (
             not isinstance(index, type(None))
             and not isinstance(big_npy, type(None))
             and index_rate != 0
         ):
-            npy = feats[0].cpu().numpy()
-            if self.is_half:
-                npy = npy.astype("float32")
-
-            # _, I = index.search(npy, 1)
-            # npy = big_npy[I.squeeze()]
-
-            try:
-                score, ix = index.search(npy, k=8)
-            except:
-                raise Exception("index mistatch")
-            weight = np.square(1 / score)
-            weight /= weight.sum(axis=1, keepdims=True)
-            npy = np.sum(big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
-
-            if self.is_half:
-                npy = npy.astype("float16")
-            feats = (
-                torch.from_numpy(npy).unsqueeze(0).to(self.device) * index_rate
-                + (1 - index_rate) * feats
-            )
+            # 各段有效帧拼接后一次检索
+            x = torch.cat([feats[i, :n] for i, n in enumerate(n_frames)])
+            with profiler.stage("index", feats=x):
+                if isinstance(index, TorchIndex):
+                    npy = index.blend(x, index_rate)
+                else:
+                    npy = x.cpu().numpy()
+                    if self.is_half:
+                        npy = npy.astype("float32")
+                    try:
+                        score, ix = index.search(npy, k=8)
+                    except:
+                        raise Exception("index mistatch")
+                    weight = np.square(1 / score)
+                    weight /= weight.sum(axis=1, keepdims=True)
+                    npy = np.sum(big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
+                    if self.is_half:
+                        npy = npy.astype("float16")
+                    npy = torch.from_numpy(npy).to(self.device)
+                    npy = npy * index_rate + (1 - index_rate) * x
+                offset = 0
+                for i, n in enumerate(n_frames):
+                    feats[i, :n] = npy[offset : offset + n]
+                    offset += n
 
+        p_lens = [min(lengths[i] // self.window, 2 * n_frames[i]) for i in range(n_seg)]
         feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
-        if protect < 0.5 and pitch is not None and pitchf is not None:
+        feats = feats[:, : max(p_lens)]
+        if feats0 is not None:
             feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(
                 0, 2, 1
             )
+            feats0 = feats0[:, : max(p_lens)]
+        del padding_mask
+        times[0] += time() - t0
+        return feats, feats0, p_lens
+
+    def synthesize(
+        self,
+        net_g,
+        sid,
+        feats,
+        feats0,
+        p_lens,
+        pitches,
+        pitchfs,
+        times,
+        protect,
+        profiler=null_profiler,
+    ):
         t1 = time()
-        p_len = audio0.shape[0] // self.window
-        if feats.shape[1] < p_len:
-            p_len = feats.shape[1]
-            if pitch is not None and pitchf is not None:
-                pitch = pitch[:, :p_len]
-                pitchf = pitchf[:, :p_len]
-
-        if protect < 0.5 and pitch is not None and pitchf is not None:
+        n_seg, max_p_len = feats.shape[0], feats.shape[1]
+        pitch = pitchf = None
+        if pitches[0] is not None and pitchfs[0] is not None:
+            pitch = torch.zeros(
+                n_seg, max_p_len, dtype=pitches[0].dtype, device=self.device
+            )
+            pitchf = torch.zeros(
+                n_seg, max_p_len, dtype=pitchfs[0].dtype, device=self.device
+            )
+            for i in range(n_seg):
+                n = min(p_lens[i], pitches[i].shape[1])
+                pitch[i, :n] = pitches[i][0, :n]
+                pitchf[i, :n] = pitchfs[i][0, :n]
+
+        if protect < 0.5 and pitch is not None and feats0 is not None:
             pitchff = pitchf.clone()
             pitchff[pitchf > 0] = 1
             pitchff[pitchf < 1] = protect
             pitchff = pitchff.unsqueeze(-1)
             feats = feats * pitchff + feats0 * (1 - pitchff)
             feats = feats.to(feats0.dtype)
-        p_len = torch.tensor([p_len], device=self.device).long()
-        with torch.no_grad():
+        p_len = torch.tensor(p_lens, device=self.device).long()
+        with profiler.stage("synth", feats=feats) as sizes, torch.no_grad():
             audio1 = (
-                (
-                    net_g.infer(
-                        feats,
-                        p_len,
-                        sid,
-                        pitch=pitch,
-                        pitchf=pitchf,
-                    )[0, 0]
-                )
+                net_g.infer(
+                    feats,
+                    p_len,
+                    sid.repeat(n_seg),
+                    pitch=pitch,
+                    pitchf=pitchf,
+                )[:, 0]
                 .data.cpu()
                 .float()
                 .numpy()
             )
-        del feats, p_len, padding_mask
+            sizes["audio"] = audio1
+        upp = audio1.shape[1] // max_p_len
+        audio_opt = [audio1[i, : p_lens[i] * upp] for i in range(n_seg)]
+        del feats, feats0, p_len, audio1
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         elif torch.backends.mps.is_available():
             torch.mps.empty_cache()
         t2 = time()
-        times[0] += t1 - t0
         times[2] += t2 - t1
-        return audio1
+        return audio_opt
+
+    def load_index(self, file_index):
+        """
+        开启 index_on_device 时优先返回常驻 device 的 TorchIndex,
+        显存不足则回退到 faiss
+        """
+        index, big_npy = load_index(file_index)
+        if self.index_on_device:
+            index = load_torch_index(file_index, self.device, self.is_half) or index
+        return index, big_npy
+
+    def _calculate_f0(self, *args, profiler=null_profiler):
+        t = time()
+        with profiler.stage("f0", audio=args[0]) as sizes:
+            pitch, pitchf = self.f0_gen.calculate(*args)
+            sizes["pitchf"] = pitchf
+        return pitch, pitchf, time() - t
 
     def pipeline(
         self,
@@ -202,7 +393,14 @@ class Pipeline(object):
         version,
         protect,
         f0_file=None,
+        batch_size=1,
+        profiler=null_profiler,
     ):
+        """
+        整段计算 f0, 按切点分段后每 batch_size 段一次提取特征与合成.
+        f0 在后台线程计算, 只与第一批的特征提取重叠: 合成第一批前必须拿到 f0,
+        其余各批在合成前才提取特征, 不与 f0 重叠, 以免所有特征同时留在 device 上
+        """
         if (
             file_index != ""
             # and file_big_npy != ""
@@ -211,29 +409,22 @@ class Pipeline(object):
             and index_rate != 0
         ):
             try:
-                index = faiss.read_index(file_index)
-                big_npy = index.reconstruct_n(0, index.ntotal)
+                index, big_npy = self.load_index(file_index)
             except:
                 traceback.print_exc()
                 index = big_npy = None
         else:
             index = big_npy = None
-        audio = signal.filtfilt(bh, ah, audio)
-        audio_pad = np.pad(audio, (self.window // 2, self.window // 2), mode="reflect")
+        with profiler.stage("filter", audio=audio):
+            audio = signal.filtfilt(bh, ah, audio)
+            audio_pad = np.pad(
+                audio, (self.window // 2, self.window // 2), mode="reflect"
+            )
         opt_ts = []
-        if audio_pad.shape[0] > self.t_max:
-            audio_sum = np.zeros_like(audio)
-            for i in range(self.window):
-                audio_sum += np.abs(audio_pad[i : i - self.window])
-            for t in range(self.t_center, audio.shape[0], self.t_center):
-                opt_ts.append(
-                    t
-                    - self.t_query
-                    + np.where(
-                        audio_sum[t - self.t_query : t + self.t_query]
-                        == audio_sum[t - self.t_query : t + self.t_query].min()
-                    )[0][0]
-                )
+        with profiler.stage("split") as sizes:
+            if audio_pad.shape[0] > self.t_max:
+                opt_ts = get_opt_ts(audio_pad, self.window, self.t_center, self.t_query)
+            sizes["n_cut"] = len(opt_ts)
         s = 0
         audio_opt = []
         t = None
@@ -254,17 +445,59 @@ class Pipeline(object):
             except:
                 traceback.print_exc()
         sid = torch.tensor(sid, device=self.device).unsqueeze(0).long()
+        segments = []  # (音频起点, 音频终点, f0起点, f0终点)
+        for t in opt_ts:
+            t = t // self.window * self.window
+            segments.append(
+                (
+                    s,
+                    t + self.t_pad2 + self.window,
+                    s // self.window,
+                    (t + self.t_pad2) // self.window,
+                )
+            )
+            s = t
+        segments.append((t, None, t // self.window if t is not None else None, None))
+        batch_size = max(batch_size, 1)
+        batches = [
+            segments[i : i + batch_size] for i in range(0, len(segments), batch_size)
+        ]
+        # f0 与 hubert 互不依赖, f0 在后台线程计算的同时只提取第一批特征.
+        # 其余各批在合成前才提取 (此时 f0 已算完), 特征只在 device 上保留一批
+        t2 = time()
+        f0_time = 0
+        if if_f0 == 1:
+            f0_task = self.f0_executor.submit(
+                self._calculate_f0,
+                audio_pad,
+                p_len,
+                f0_up_key,
+                f0_method,
+                filter_radius,
+                inp_f0,
+                profiler=profiler,
+            )
+
+        def batch_features(batch):
+            return self.extract_features(
+                model,
+                [audio_pad[s:e] for s, e, _, _ in batch],
+                times,
+                index,
+                big_npy,
+                index_rate,
+                version,
+                protect < 0.5 and bool(if_f0),
+                profiler,
+            )
+
+        npy_time = times[0]
+        first_feats = batch_features(batches[0])
+        npy_time = times[0] - npy_time
         pitch, pitchf = None, None
         if if_f0:
             if if_f0 == 1:
-                pitch, pitchf = self.f0_gen.calculate(
-                    audio_pad,
-                    p_len,
-                    f0_up_key,
-                    f0_method,
-                    filter_radius,
-                    inp_f0,
-                )
+                pitch, pitchf, f0_time = f0_task.result()
             elif if_f0 == 2:
                 pitch, pitchf = f0_method
             pitch = pitch[:p_len]
@@ -273,94 +506,200 @@ class Pipeline(object):
                 pitchf = pitchf.astype(np.float32)
             pitch = torch.tensor(pitch, device=self.device).unsqueeze(0).long()
             pitchf = torch.tensor(pitchf, device=self.device).unsqueeze(0).float()
-        t2 = time()
-        times[1] += t2 - t1
-        for t in opt_ts:
-            t = t // self.window * self.window
-            if if_f0:
-                audio_opt.append(
-                    self.vc(
-                        model,
-                        net_g,
-                        sid,
-                        audio_pad[s : t + self.t_pad2 + self.window],
-                        pitch[:, s // self.window : (t + self.t_pad2) // self.window],
-                        pitchf[:, s // self.window : (t + self.t_pad2) // self.window],
-                        times,
-                        index,
-                        big_npy,
-                        index_rate,
-                        version,
-                        protect,
-                    )[self.t_pad_tgt : -self.t_pad_tgt]
-                )
-            else:
-                audio_opt.append(
-                    self.vc(
-                        model,
-                        net_g,
-                        sid,
-                        audio_pad[s : t + self.t_pad2 + self.window],
-                        None,
-                        None,
-                        times,
-                        index,
-                        big_npy,
-                        index_rate,
-                        version,
-                        protect,
-                    )[self.t_pad_tgt : -self.t_pad_tgt]
-                )
-            s = t
-        if if_f0:
-            audio_opt.append(
-                self.vc(
-                    model,
-                    net_g,
-                    sid,
-                    audio_pad[t:],
-                    pitch[:, t // self.window :] if t is not None else pitch,
-                    pitchf[:, t // self.window :] if t is not None else pitchf,
-                    times,
-                    index,
-                    big_npy,
-                    index_rate,
-                    version,
-                    protect,
-                )[self.t_pad_tgt : -self.t_pad_tgt]
-            )
-        else:
-            audio_opt.append(
-                self.vc(
-                    model,
-                    net_g,
-                    sid,
-                    audio_pad[t:],
-                    None,
-                    None,
-                    times,
-                    index,
-                    big_npy,
-                    index_rate,
-                    version,
-                    protect,
-                )[self.t_pad_tgt : -self.t_pad_tgt]
-            )
+        t3 = time()
+        times[1] += t2 - t1 + f0_time
+        if len(times) > 3:  # f0 与第一批特征提取重叠执行节省的时间
+            times[3] += max(npy_time + f0_time - (t3 - t2), 0)
+        for i, batch in enumerate(batches):
+            feats, feats0, p_lens = first_feats if i == 0 else batch_features(batch)
+            first_feats = None
+            for audio1 in self.synthesize(
+                net_g,
+                sid,
+                feats,
+                feats0,
+                p_lens,
+                [pitch[:, s:e] if if_f0 else None for _, _, s, e in batch],
+                [pitchf[:, s:e] if if_f0 else None for _, _, s, e in batch],
+                times,
+                protect,
+                profiler,
+            ):
+                audio_opt.append(audio1[self.t_pad_tgt : -self.t_pad_tgt])
+            del feats, feats0
         audio_opt = np.concatenate(audio_opt)
         if rms_mix_rate != 1:
-            audio_opt = change_rms(audio, 16000, audio_opt, tgt_sr, rms_mix_rate)
+            with profiler.stage("rms", audio=audio_opt):
+                audio_opt = change_rms(audio, 16000, audio_opt, tgt_sr, rms_mix_rate)
         if tgt_sr != resample_sr >= 16000:
-            audio_opt = librosa.resample(
-                audio_opt, orig_sr=tgt_sr, target_sr=resample_sr
-            )
-        audio_max = np.abs(audio_opt).max() / 0.99
-        max_int16 = 32768
-        if audio_max > 1:
-            max_int16 /= audio_max
-        np.multiply(audio_opt, max_int16, audio_opt)
+            with profiler.stage("resample", audio=audio_opt) as sizes:
+                audio_opt = resample(audio_opt, tgt_sr, resample_sr, hq=True).numpy()
+                sizes["audio_opt"] = audio_opt
+        with profiler.stage("encode", audio=audio_opt):
+            audio_max = np.abs(audio_opt).max() / 0.99
+            max_int16 = 32768
+            if audio_max > 1:
+                max_int16 /= audio_max
+            np.multiply(audio_opt, max_int16, audio_opt)
         del pitch, pitchf, sid
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         elif torch.backends.mps.is_available():
             torch.mps.empty_cache()
         return audio_opt
+
+    def stream(
+        self,
+        model,
+        net_g,
+        sid,
+        audio_blocks,
+        times,
+        f0_up_key,
+        f0_method,
+        file_index,
+        index_rate,
+        if_f0,
+        filter_radius,
+        tgt_sr,
+        resample_sr,
+        rms_mix_rate,
+        version,
+        protect,
+    ):
+        """
+        逐块读入 16k 单声道音频 (audio_blocks 为 ndarray 的可迭代对象, 长度任意),
+        按与 pipeline 相同的切点逻辑和 reflect 补齐分段推理, 每完成一段就产出一块
+        int16 音频. 内存占用只与分段长度有关, 与总时长无关.
+
+        与 pipeline 的差异: 高通滤波, f0 与 rms 混合均带上下文逐段进行;
+        无法预知全局峰值, 因此不做整体归一化, 而是截幅到 ±0.99
+        """
+        index = big_npy = None
+        if file_index != "" and os.path.exists(file_index) and index_rate != 0:
+            try:
+                index, big_npy = self.load_index(file_index)
+            except:
+                traceback.print_exc()
+        sid = torch.tensor(sid, device=self.device).unsqueeze(0).long()
+        ctx = self.sr // 2  # 分段高通滤波前后多取的上下文
+        half_window = self.window // 2
+        blocks = iter(audio_blocks)
+        raw = np.zeros(0)  # 原始坐标 [raw_start, raw_start + len(raw)) 的输入
+        raw_start = 0
+        n_total = None  # 输入读完后为总点数
+        s = 0  # 当前段起点 (原始坐标)
+        next_t = self.t_center
+        resampler = (
+            Resampler(tgt_sr, resample_sr, hq=True)
+            if tgt_sr != resample_sr >= 16000
+            else None
+        )
+        while True:
+            # 读到足以确定下一个切点及该段后侧补齐为止
+            need = (
+                max(next_t + self.t_query, self.t_max) + self.t_pad + self.window + ctx
+            )
+            while n_total is None and raw_start + raw.shape[0] < need:
+                try:
+                    raw = np.concatenate((raw, np.asarray(next(blocks), np.float64)))
+                except StopIteration:
+                    n_total = raw_start + raw.shape[0]
+            last = n_total is not None and (
+                n_total + half_window * 2 <= self.t_max or next_t >= n_total
+            )
+            r0 = max(s - self.t_pad - ctx, 0)
+            filt = signal.filtfilt(bh, ah, raw[r0 - raw_start :])
+
+            def take(a, b):
+                # 原始坐标 [a, b) 的滤波后音频, 越过首尾的部分同 np.pad(mode="reflect")
+                idx = np.abs(np.arange(a, b))
+                if n_total is not None:
+                    idx = np.where(idx >= n_total, 2 * (n_total - 1) - idx, idx)
+                return filt[idx - r0]
+
+            if last:
+                t = None
+                audio0 = take(s - self.t_pad, n_total + self.t_pad)
+            else:
+                j0 = next_t - self.t_query
+                audio_cum = np.zeros(2 * self.t_query + self.window + 1)
+                np.cumsum(
+                    np.abs(take(j0 - half_window, next_t + self.t_query + half_window)),
+                    out=audio_cum[1:],
+                )
+                audio_sum = (
+                    audio_cum[self.window : self.window + 2 * self.t_query]
+                    - audio_cum[: 2 * self.t_query]
+                )
+                if n_total is not None:
+                    audio_sum[max(n_total - j0, 0) :] = np.inf
+                t = (j0 + int(audio_sum.argmin())) // self.window * self.window
+                audio0 = take(s - self.t_pad, t + self.t_pad + self.window)
+
+            p_len = audio0.shape[0] // self.window
+            if if_f0:
+                f0_task = self.f0_executor.submit(
+                    self._calculate_f0,
+                    audio0,
+                    p_len,
+                    f0_up_key,
+                    f0_method,
+                    filter_radius,
+                    None,
+                )
+            feats, feats0, p_lens = self.extract_features(
+                model,
+                [audio0],
+                times,
+                index,
+                big_npy,
+                index_rate,
+                version,
+                protect < 0.5 and bool(if_f0),
+            )
+            pitch, pitchf = None, None
+            if if_f0:
+                pitch, pitchf, f0_time = f0_task.result()
+                times[1] += f0_time
+                if t is not None:
+                    p_len = (t + self.t_pad2 - s) // self.window
+                pitch = pitch[:p_len]
+                pitchf = pitchf[:p_len]
+                if "mps" not in str(self.device) or "xpu" not in str(self.device):
+                    pitchf = pitchf.astype(np.float32)
+                pitch = torch.tensor(pitch, device=self.device).unsqueeze(0).long()
+                pitchf = torch.tensor(pitchf, device=self.device).unsqueeze(0).float()
+            audio1 = self.synthesize(
+                net_g, sid, feats, feats0, p_lens, [pitch], [pitchf], times, protect
+            )[0][self.t_pad_tgt : -self.t_pad_tgt]
+            del feats, feats0, pitch, pitchf
+            if rms_mix_rate != 1:
+                audio1 = change_rms(
+                    take(s, s + audio1.shape[0] * self.sr // tgt_sr),
+                    self.sr,
+                    audio1,
+                    tgt_sr,
+                    rms_mix_rate,
+                )
+            if resampler is not None:
+                # 滤波器状态跨段保留, 输出与整段重采样一致
+                audio1 = resampler.stream(audio1)
+                if last:
+                    audio1 = torch.cat((audio1, resampler.flush()))
+                audio1 = audio1.numpy()
+            yield (np.clip(audio1, -0.99, 0.99) * 32768).astype(np.int16)
+            if last:
+                break
+            s = t
+            next_t += self.t_center
+            # 丢弃后续各段都用不到的输入
+            n_drop = s - self.t_pad - ctx - raw_start
+            if n_drop > 0:
+                raw = raw[n_drop:]
+                raw_start += n_drop
+        del sid
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        elif torch.backends.mps.is_available():
+            torch.mps.empty_cache()
@@ -1,4 +1,4 @@
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 import torch
 import numpy as np
@@ -28,43 +28,83 @@ class F0Predictor(object):
         filter_radius: Optional[Union[int, float]] = None,
     ): ...
 
+    def batch_key(self, n_samples: int) -> int:
+        """
+        compute_f0_batch 的分组依据, 同组的音频可以在一次前向中处理
+        """
+        return n_samples
+
+    def compute_f0_batch(
+        self,
+        wavs: List[Union[np.ndarray, torch.Tensor]],
+        p_lens: List[Optional[int]],
+        filter_radius: Optional[Union[int, float]] = None,
+    ) -> List[np.ndarray]:
+        """
+        对 batch_key 相同的一组音频计算 f0, 默认逐个调用 compute_f0,
+        神经网络方法重写为一次批量前向
+        """
+        return [
+            self.compute_f0(wav, p_len=p_len, filter_radius=filter_radius)
+            for wav, p_len in zip(wavs, p_lens)
+        ]
+
     def _interpolate_f0(self, f0: np.ndarray):
         """
         对F0进行插值处理
+
+        无声区间 [i, j) 自第一个 <= 0 的帧起, 到下一个 > 0 的帧 j 前, 按段向量化
+        填充, 结果与逐帧循环的实现逐位一致 (原地修改 f0). 记 last = data[i - 1]:
+            last > 0: last + (data[j] - last) / (j - i) * (k - i + 1)
+            前无浊音: data[j]
+            其后无浊音, 或 j 为最后一帧: last, 开头为 0
         """
 
-        data = np.reshape(f0, (f0.size, 1))
+        data = np.reshape(f0, (f0.size,))
 
-        vuv_vector = np.zeros((data.size, 1), dtype=np.float32)
+        vuv_vector = np.zeros(data.size, dtype=np.float32)
         vuv_vector[data > 0.0] = 1.0
-        vuv_vector[data <= 0.0] = 0.0
 
         ip_data = data
 
         frame_number = data.size
-        last_value = 0.0
-        for i in range(frame_number):
-            if data[i] <= 0.0:
-                j = i + 1
-                for j in range(i + 1, frame_number):
-                    if data[j] > 0.0:
-                        break
-                if j < frame_number - 1:
-                    if last_value > 0.0:
-                        step = (data[j] - data[i - 1]) / float(j - i)
-                        for k in range(i, j):
-                            ip_data[k] = data[i - 1] + step * (k - i + 1)
-                    else:
-                        for k in range(i, j):
-                            ip_data[k] = data[j]
-                else:
-                    for k in range(i, frame_number):
-                        ip_data[k] = last_value
-            else:
-                ip_data[i] = data[i]  # 这里可能存在一个没有必要的拷贝
-                last_value = data[i]
+        unvoiced = np.flatnonzero(data <= 0.0)
+        if unvoiced.size == 0:
+            return ip_data, vuv_vector
+        voiced = np.flatnonzero(data > 0.0)
+        # 每帧之前 (含) 的浊音帧数, 同一段无声区间内相同
+        n_voiced = np.cumsum(data > 0.0)
+        segment = n_voiced[unvoiced]
+        starts = unvoiced[np.r_[True, segment[1:] != segment[:-1]]]
+        next_idx = n_voiced[starts]
+        ends = np.full(starts.shape, frame_number)
+        has_next = next_idx < voiced.size
+        ends[has_next] = voiced[next_idx[has_next]]
+        tail = ends >= frame_number - 1
+        last = np.zeros(starts.shape, dtype=data.dtype)
+        last[starts > 0] = data[starts[starts > 0] - 1]
+        interp = ~tail & (last > 0.0)
+        base = np.where(tail, last, data[np.minimum(ends, frame_number - 1)])
+        base[interp] = last[interp]
+        step = np.zeros(starts.shape, dtype=data.dtype)
+        step[interp] = (data[ends[interp]] - last[interp]) / (
+            ends[interp] - starts[interp]
+        ).astype(data.dtype)
+        ends[tail] = frame_number
+        # 展开为逐帧下标, offset 为帧在区间内的位置 k - i
+        lengths = ends - starts
+        offset = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        index = np.repeat(starts, lengths) + offset
+        values = np.repeat(base, lengths)
+        mask = np.repeat(interp, lengths)
+        values[mask] += np.repeat(step, lengths)[mask] * (offset[mask] + 1).astype(
+            data.dtype
+        )
+        ip_data[index] = values
 
-        return ip_data[:, 0], vuv_vector[:, 0]
+        return ip_data, vuv_vector
 
     def _resize_f0(self, x: np.ndarray, target_len: int):
         source = np.array(x)
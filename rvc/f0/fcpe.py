@@ -1,4 +1,4 @@
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 import numpy as np
 import torch
@@ -51,3 +51,33 @@ class FCPE(F0Predictor):
             .numpy()
         )
         return self._interpolate_f0(self._resize_f0(f0, p_len))[0]
+
+    def compute_f0_batch(
+        self,
+        wavs: List[Union[np.ndarray, torch.Tensor]],
+        p_lens: List[Optional[int]],
+        filter_radius: Optional[Union[int, float]] = 0.006,
+    ) -> List[np.ndarray]:
+        # 同组音频长度相同, 直接堆叠为一个 batch
+        wav = torch.stack(
+            [wav if torch.is_tensor(wav) else torch.from_numpy(wav) for wav in wavs]
+        )
+        f0s = (
+            self.model.infer(
+                wav.float().to(self.device),
+                sr=self.sampling_rate,
+                decoder_mode="local_argmax",
+                threshold=filter_radius,
+            )
+            .squeeze(-1)
+            .cpu()
+            .numpy()
+        )
+        return [
+            self._interpolate_f0(
+                self._resize_f0(
+                    f0, wav.shape[1] // self.hop_length if p_len is None else p_len
+                )
+            )[0]
+            for f0, p_len in zip(f0s, p_lens)
+        ]
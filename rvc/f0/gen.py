@@ -1,6 +1,8 @@
+from concurrent.futures import ProcessPoolExecutor
 from math import log
+import multiprocessing
 from pathlib import Path
-from typing import Optional, Union, Literal, Tuple
+from typing import List, Optional, Union, Literal, Tuple
 
 from numba import jit
 import numpy as np
@@ -50,13 +52,37 @@ class Generator(object):
         device="cpu",
         window=160,
         sr=16000,
+        rmvpe_chunk_frames=0,
+        n_cpu=1,
+        rmvpe_chunk_batch=1,
     ):
+        """
+        rmvpe_chunk_frames > 0 时 rmvpe 按块推理, 每次前向 rmvpe_chunk_batch 块,
+        见 RMVPE._wav2f0_chunked.
+        n_cpu > 1 时 dio 与 harvest 把长音频分段交给常驻进程池, 见 _compute_cpu_f0;
+        实时变声每块只有几十帧, 不足以分段, 应保持 n_cpu = 1.
+        进程池以 spawn 启动, 子进程会重新导入 __main__, 入口需要 __main__ 保护;
+        用完后调用 close 关闭
+        """
         self.rmvpe_root = rmvpe_root
         self.is_half = is_half
         self.x_pad = x_pad
         self.device = device
         self.window = window
         self.sr = sr
+        self.rmvpe_chunk_frames = rmvpe_chunk_frames
+        self.rmvpe_chunk_batch = rmvpe_chunk_batch
+        self.n_cpu = n_cpu
+        self.cpu_pool = None
+        if n_cpu > 1:
+            # 不 fork 已经运行 cuda 与多线程的进程; spawn 的子进程在首次提交时才启动
+            self.cpu_pool = ProcessPoolExecutor(
+                n_cpu, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    # 进程池分段时每段至少 cpu_chunk_frames 帧, 两侧各多算 cpu_chunk_overlap 帧上下文
+    cpu_chunk_frames = 100
+    cpu_chunk_overlap = 25
 
     def calculate(
         self,
@@ -82,51 +108,22 @@ class Generator(object):
                 from .dio import Dio
 
                 self.dio = Dio(self.window, f0_min, f0_max, self.sr)
-            f0 = self.dio.compute_f0(x, p_len=p_len)
+            f0 = self._compute_cpu_f0(self.dio, x, p_len, filter_radius)
         elif f0_method == "harvest":
             if not hasattr(self, "harvest"):
                 from .harvest import Harvest
 
                 self.harvest = Harvest(self.window, f0_min, f0_max, self.sr)
-            f0 = self.harvest.compute_f0(x, p_len=p_len, filter_radius=filter_radius)
+            f0 = self._compute_cpu_f0(self.harvest, x, p_len, filter_radius)
         elif f0_method == "crepe":
-            if not hasattr(self, "crepe"):
-                from .crepe import CRePE
-
-                self.crepe = CRePE(
-                    self.window,
-                    f0_min,
-                    f0_max,
-                    self.sr,
-                    self.device,
-                )
-            f0 = self.crepe.compute_f0(x, p_len=p_len)
+            f0 = self._get_crepe().compute_f0(x, p_len=p_len)
         elif f0_method == "rmvpe":
-            if not hasattr(self, "rmvpe"):
-                from .rmvpe import RMVPE
-
-                self.rmvpe = RMVPE(
-                    str(self.rmvpe_root / "rmvpe.pt"),
-                    is_half=self.is_half,
-                    device=self.device,
-                    # use_jit=self.config.use_jit,
-                )
-            f0 = self.rmvpe.compute_f0(x, p_len=p_len, filter_radius=0.03)
+            f0 = self._get_rmvpe().compute_f0(x, p_len=p_len, filter_radius=0.03)
             if "privateuseone" in str(self.device):  # clean ortruntime memory
                 del self.rmvpe.model
                 del self.rmvpe
         elif f0_method == "fcpe":
-            if not hasattr(self, "fcpe"):
-                from .fcpe import FCPE
-
-                self.fcpe = FCPE(
-                    self.window,
-                    f0_min,
-                    f0_max,
-                    self.sr,
-                    self.device,
-                )
-            f0 = self.fcpe.compute_f0(x, p_len=p_len)
+            f0 = self._get_fcpe().compute_f0(x, p_len=p_len)
         else:
             raise ValueError(f"f0 method {f0_method} has not yet been supported")
 
@@ -139,3 +136,134 @@ class Generator(object):
             1127 * log(1 + f0_max / 700),
             manual_f0,
         )
+
+    def calculate_batch(
+        self,
+        xs: List[Union[np.ndarray, torch.Tensor]],
+        p_lens: Optional[List[Optional[int]]],
+        f0_up_key: int,
+        f0_method: Literal["pm", "dio", "harvest", "crepe", "rmvpe", "fcpe"],
+        filter_radius: Optional[Union[int, float]],
+        batch_size: int = 16,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        对多段音频计算 f0 (如提取训练集 f0), 返回与 xs 一一对应的 calculate 结果.
+        rmvpe 与 fcpe 按 predictor.batch_key (补齐后的长度) 分组, 每组最多
+        batch_size 段一次前向, 其后逐段 post_process; 其余方法 (以及 DirectML)
+        逐段调用 calculate. torchcrepe 已在每段内部按 512 帧成批前向, 不再打包
+        """
+        if p_lens is None:
+            p_lens = [None] * len(xs)
+        if f0_method not in ("rmvpe", "fcpe") or "privateuseone" in str(self.device):
+            return [
+                self.calculate(x, p_len, f0_up_key, f0_method, filter_radius)
+                for x, p_len in zip(xs, p_lens)
+            ]
+        if f0_method == "rmvpe":
+            predictor, thred = self._get_rmvpe(), 0.03
+        else:
+            predictor, thred = self._get_fcpe(), 0.006
+        groups = {}
+        for i, x in enumerate(xs):
+            groups.setdefault(predictor.batch_key(x.shape[0]), []).append(i)
+        results = [None] * len(xs)
+        for indices in groups.values():
+            for start in range(0, len(indices), batch_size):
+                batch = indices[start : start + batch_size]
+                f0s = predictor.compute_f0_batch(
+                    [xs[i] for i in batch], [p_lens[i] for i in batch], thred
+                )
+                for i, f0 in zip(batch, f0s):
+                    results[i] = post_process(
+                        self.sr // self.window,
+                        f0,
+                        f0_up_key,
+                        self.x_pad,
+                        1127 * log(1 + 50 / 700),
+                        1127 * log(1 + 1100 / 700),
+                    )
+        return results
+
+    def _compute_cpu_f0(
+        self,
+        predictor,
+        x: np.ndarray,
+        p_len: Optional[int],
+        filter_radius: Optional[Union[int, float]],
+    ) -> np.ndarray:
+        """
+        dio 与 harvest 都是单线程的. 音频够长时按 hop 切成 n_cpu 段,
+        每段带两侧上下文交给进程池计算 predictor._raw_f0, 只取各段中间的帧拼接,
+        再整段做 predictor._raw2f0. 段的边界处与整段计算只有细微差别.
+        没有 _raw_f0 的 predictor 整段计算; pm (parselmouth) 在整段上做全局的
+        路径搜索, 分段结果不等价, 不走这里
+        """
+        n_frames = x.shape[0] // self.window + 1
+        n_chunks = min(self.n_cpu, n_frames // self.cpu_chunk_frames)
+        if n_chunks <= 1 or self.cpu_pool is None or not hasattr(predictor, "_raw_f0"):
+            return predictor.compute_f0(x, p_len=p_len, filter_radius=filter_radius)
+        if p_len is None:
+            p_len = x.shape[0] // self.window
+        chunk = -(-n_frames // n_chunks)
+        jobs = []
+        for start in range(0, n_frames, chunk):
+            context_start = max(start - self.cpu_chunk_overlap, 0)
+            context_end = start + chunk + self.cpu_chunk_overlap
+            future = self.cpu_pool.submit(
+                predictor._raw_f0,
+                x[context_start * self.window : context_end * self.window],
+            )
+            jobs.append((start - context_start, future))
+        f0 = np.concatenate(
+            [future.result()[offset : offset + chunk] for offset, future in jobs]
+        )
+        return predictor._raw2f0(f0, p_len, filter_radius)
+
+    def close(self):
+        """
+        关闭 dio 与 harvest 使用的进程池, 之后的计算都在当前进程中进行
+        """
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown()
+            self.cpu_pool = None
+        self.n_cpu = 1
+
+    def _get_rmvpe(self):
+        if not hasattr(self, "rmvpe"):
+            from .rmvpe import RMVPE
+
+            self.rmvpe = RMVPE(
+                str(self.rmvpe_root / "rmvpe.pt"),
+                is_half=self.is_half,
+                device=self.device,
+                # use_jit=self.config.use_jit,
+                chunk_frames=self.rmvpe_chunk_frames,
+                chunk_batch=self.rmvpe_chunk_batch,
+            )
+        return self.rmvpe
+
+    def _get_crepe(self):
+        if not hasattr(self, "crepe"):
+            from .crepe import CRePE
+
+            self.crepe = CRePE(
+                self.window,
+                50,
+                1100,
+                self.sr,
+                self.device,
+            )
+        return self.crepe
+
+    def _get_fcpe(self):
+        if not hasattr(self, "fcpe"):
+            from .fcpe import FCPE
+
+            self.fcpe = FCPE(
+                self.window,
+                50,
+                1100,
+                self.sr,
+                self.device,
+            )
+        return self.fcpe
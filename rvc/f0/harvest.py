@@ -19,14 +19,29 @@ class Harvest(F0Predictor):
     ):
         if p_len is None:
             p_len = wav.shape[0] // self.hop_length
+        return self._raw2f0(self._raw_f0(wav), p_len, filter_radius)
+
+    def _raw_f0(self, wav: np.ndarray) -> np.ndarray:
+        """
+        逐 hop 的原始 f0, 第 i 帧位于 i * hop_length 处且只依赖附近的音频,
+        Generator 据此分段并行计算后拼接, 再整段交给 _raw2f0
+        """
+        wav = wav.astype(np.double)
         f0, t = pyworld.harvest(
-            wav.astype(np.double),
+            wav,
             fs=self.sampling_rate,
             f0_ceil=self.f0_max,
             f0_floor=self.f0_min,
             frame_period=1000 * self.hop_length / self.sampling_rate,
         )
-        f0 = pyworld.stonemask(wav.astype(np.double), f0, t, self.sampling_rate)
+        return pyworld.stonemask(wav, f0, t, self.sampling_rate)
+
+    def _raw2f0(
+        self,
+        f0: np.ndarray,
+        p_len: int,
+        filter_radius: Optional[Union[int, float]],
+    ) -> np.ndarray:
         if filter_radius is not None and filter_radius > 2:
             f0 = signal.medfilt(f0, filter_radius)
         return self._interpolate_f0(self._resize_f0(f0, p_len))[0]
@@ -38,13 +38,23 @@ def rmvpe_jit_export(
 
 
 class RMVPE(F0Predictor):
+    # 1024 点窗的一半需要两侧 4 个 hop 的上下文, 更靠边的帧受边界填充影响
+    mel_context = 4
+
     def __init__(
         self,
         model_path: str,
         is_half: bool,
         device: str,
         use_jit=False,
+        chunk_frames: int = 0,
+        chunk_overlap: int = 128,
+        chunk_batch: int = 1,
     ):
+        """
+        chunk_frames > 0 时 compute_f0 按块推理, 显存占用与音频长度无关,
+        见 _wav2f0_chunked
+        """
         hop_length = 160
         f0_min = 30
         f0_max = 8000
@@ -59,8 +69,18 @@ class RMVPE(F0Predictor):
         )
 
         self.is_half = is_half
+        self.chunk_frames = chunk_frames
+        self.chunk_overlap = chunk_overlap
+        self.chunk_batch = chunk_batch
         cents_mapping = 20 * np.arange(360) + 1997.3794084376191
         self.cents_mapping = np.pad(cents_mapping, (4, 4))  # 368
+        # 在 device 上解码 salience 时使用, mps 不支持 float64
+        self.cents_mapping_t: Optional[torch.Tensor] = None
+        if "privateuseone" not in str(self.device):
+            self.cents_mapping_t = torch.from_numpy(self.cents_mapping).to(
+                self.device,
+                torch.float32 if "mps" in str(self.device) else torch.float64,
+            )
 
         self.mel_extractor = MelSpectrogram(
             is_half=is_half,
@@ -103,36 +123,120 @@ class RMVPE(F0Predictor):
             p_len = wav.shape[0] // self.hop_length
         if not torch.is_tensor(wav):
             wav = torch.from_numpy(wav)
-        mel = self.mel_extractor(wav.float().to(self.device).unsqueeze(0), center=True)
-        hidden = self._mel2hidden(mel)
-        if "privateuseone" not in str(self.device):
-            hidden = hidden.squeeze(0).cpu().numpy()
+        n_frames = wav.shape[0] // self.hop_length + 1
+        if (
+            0 < self.chunk_frames
+            and self.chunk_frames + 2 * self.chunk_overlap < n_frames
+        ):
+            f0 = self._wav2f0_chunked(wav, filter_radius)
         else:
-            hidden = hidden[0]
+            mel = self._mel(wav.float().to(self.device))
+            f0 = self._mel2f0(mel, filter_radius)
+
+        return self._interpolate_f0(self._resize_f0(f0, p_len))[0]
+
+    def batch_key(self, n_samples: int) -> int:
+        # _mel2hidden 把帧数补零到 32 的倍数, 补齐后帧数相同的音频批量推理与逐个推理一致
+        return 32 * ((n_samples // self.hop_length) // 32 + 1)
+
+    def compute_f0_batch(self, wavs, p_lens, filter_radius=None):
+        n_frames = [wav.shape[0] // self.hop_length + 1 for wav in wavs]
+        if len(wavs) == 1 or (
+            0 < self.chunk_frames
+            and self.chunk_frames + 2 * self.chunk_overlap < max(n_frames)
+        ):
+            return super().compute_f0_batch(wavs, p_lens, filter_radius)
+        length = 32 * ((max(n_frames) - 1) // 32 + 1)
+        mels = []
+        for wav in wavs:
+            if not torch.is_tensor(wav):
+                wav = torch.from_numpy(wav)
+            mel = self._mel(wav.float().to(self.device))
+            mels.append(F.pad(mel, (0, length - mel.shape[-1])))
+        hidden = self._mel2hidden(torch.cat(mels))
+        f0s = []
+        for i, (wav, p_len) in enumerate(zip(wavs, p_lens)):
+            if p_len is None:
+                p_len = wav.shape[0] // self.hop_length
+            f0 = self._hidden2f0(hidden[i, : n_frames[i]], filter_radius)
+            f0s.append(self._interpolate_f0(self._resize_f0(f0, p_len))[0])
+        return f0s
+
+    def _mel(self, wav: torch.Tensor) -> torch.Tensor:
+        return self.mel_extractor(wav.unsqueeze(0), center=True)
+
+    def _mel2f0(self, mel, filter_radius):
+        return self._hidden2f0(self._mel2hidden(mel)[0], filter_radius)
+
+    def _wav2f0_chunked(self, wav: torch.Tensor, filter_radius):
+        """
+        每块 chunk_frames 帧, 前后各带 chunk_overlap 帧上下文 (均取 32 的倍数,
+        与整段推理的池化网格对齐), 只保留中间部分; 每次前向最多 chunk_batch 块.
+        梅尔谱按块计算, 与整段计算一致; 模型含 BiGRU, 块内结果与整段推理近似,
+        上下文越长越接近. 音频留在 host, 每块只有对应片段与 f0 进出 device
+        """
+        hop = self.hop_length
+        n_frames = wav.shape[0] // hop + 1
+        chunk = 32 * ((self.chunk_frames - 1) // 32 + 1)
+        overlap = 32 * ((self.chunk_overlap + 31) // 32)
+        length = chunk + 2 * overlap
+        batch = 1 if "privateuseone" in str(self.device) else max(self.chunk_batch, 1)
+        starts = list(range(0, n_frames, chunk))
+        f0 = []
+        for i in range(0, len(starts), batch):
+            mels, spans = [], []
+            for start in starts[i : i + batch]:
+                end = min(start + chunk, n_frames)
+                ctx_start = max(start - overlap, 0)
+                ctx_end = min(end + overlap, n_frames)
+                # 前后多取 mel_context 帧, 使边界处的梅尔帧不受补齐影响
+                wav_start = max(ctx_start - self.mel_context, 0)
+                wav_end = min((ctx_end + self.mel_context) * hop, wav.shape[0])
+                mel = self._mel(wav[wav_start * hop : wav_end].float().to(self.device))
+                mel = mel[..., ctx_start - wav_start : ctx_end - wav_start]
+                mels.append(F.pad(mel, (0, length - mel.shape[-1])))
+                spans.append((start - ctx_start, end - ctx_start))
+            hidden = self._mel2hidden(torch.cat(mels))
+            for j, (start, end) in enumerate(spans):
+                f0.append(self._hidden2f0(hidden[j, start:end], filter_radius))
+        return np.concatenate(f0)
+
+    def _hidden2f0(self, hidden, filter_radius):
+        """
+        hidden 为 (帧数, 360) 的 salience
+        """
+        if "privateuseone" not in str(self.device):
+            # 在 device 上解码, 只把 f0 拷回 host
+            return self._decode(hidden.float(), thred=filter_radius)
         if self.is_half == True:
             hidden = hidden.astype("float32")
 
-        f0 = self._decode(hidden, thred=filter_radius)
-
-        return self._interpolate_f0(self._resize_f0(f0, p_len))[0]
+        return self._decode(hidden, thred=filter_radius)
 
     def _to_local_average_cents(self, salience, threshold=0.05):
-        center = np.argmax(salience, axis=1)  # 帧长#index
-        salience = np.pad(salience, ((0, 0), (4, 4)))  # 帧长,368
-        center += 4
-        todo_salience = []
-        todo_cents_mapping = []
-        starts = center - 4
-        ends = center + 5
-        for idx in range(salience.shape[0]):
-            todo_salience.append(salience[:, starts[idx] : ends[idx]][idx])
-            todo_cents_mapping.append(self.cents_mapping[starts[idx] : ends[idx]])
-        todo_salience = np.array(todo_salience)  # 帧长，9
-        todo_cents_mapping = np.array(todo_cents_mapping)  # 帧长，9
-        product_sum = np.sum(todo_salience * todo_cents_mapping, 1)
-        weight_sum = np.sum(todo_salience, 1)  # 帧长
+        """
+        以每帧 argmax 为中心的 9 个 bin 对 cents 加权平均 (越界的 bin 权重为 0),
+        一次 gather 完成. salience 为 tensor 时在其所在 device 上计算
+        """
+        if torch.is_tensor(salience):
+            center = torch.argmax(salience, 1, keepdim=True)  # 帧长,1
+            index = center + torch.arange(-4, 5, device=salience.device)  # 帧长,9
+            todo_salience = torch.gather(
+                salience, 1, index.clamp(0, salience.shape[1] - 1)
+            ) * ((index >= 0) & (index < salience.shape[1]))
+            todo_cents_mapping = self.cents_mapping_t[index + 4]
+            maxx = torch.gather(salience, 1, center)[:, 0].clamp(min=0)
+        else:
+            center = np.argmax(salience, axis=1)[:, None]  # 帧长,1
+            index = center + np.arange(-4, 5)  # 帧长,9
+            todo_salience = np.take_along_axis(
+                salience, index.clip(0, salience.shape[1] - 1), 1
+            ) * ((index >= 0) & (index < salience.shape[1]))
+            todo_cents_mapping = self.cents_mapping[index + 4]
+            maxx = np.maximum(np.take_along_axis(salience, center, 1)[:, 0], 0)
+        product_sum = (todo_salience * todo_cents_mapping).sum(1)
+        weight_sum = todo_salience.sum(1)  # 帧长
         devided = product_sum / weight_sum  # 帧长
-        maxx = np.max(salience, axis=1)  # 帧长
         devided[maxx <= threshold] = 0
         return devided
 
@@ -160,5 +264,7 @@ class RMVPE(F0Predictor):
         cents_pred = self._to_local_average_cents(hidden, threshold=thred)
         f0 = 10 * (2 ** (cents_pred / 1200))
         f0[f0 == 10] = 0
+        if torch.is_tensor(f0):
+            f0 = f0.cpu().numpy()
         # f0 = np.array([10 * (2 ** (cent_pred / 1200)) if cent_pred else 0 for cent_pred in cents_pred])
         return f0
@@ -0,0 +1,141 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class TorchIndex(object):
+    """
+    big_npy 常驻 device, 在 device 上做精确 L2 的 k 近邻检索与加权混合,
+    省去特征在 host 与 device 之间的往返. 注意 faiss 的 IVF 索引为近似检索,
+    因此两者选出的近邻可能略有不同
+    """
+
+    def __init__(self, big_npy: np.ndarray, device, is_half=False):
+        self.device = torch.device(device)
+        # cpu 上半精度矩阵乘很慢
+        self.dtype = (
+            torch.float16 if is_half and self.device.type != "cpu" else torch.float32
+        )
+        self.big_npy = torch.from_numpy(big_npy).to(self.device, self.dtype)
+        self.norm = self.big_npy.float().pow(2).sum(1)
+        self.ntotal = self.big_npy.shape[0]
+        self.nbytes = self.big_npy.numel() * self.big_npy.element_size()
+        self.nbytes += self.norm.numel() * self.norm.element_size()
+
+    @torch.no_grad()
+    def search(
+        self, x: torch.Tensor, k=8, max_bytes=256 << 20
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        与 faiss.Index.search 相同, 返回平方距离与下标, 但均为 device 上的 tensor.
+        距离矩阵按 max_bytes 分块计算
+        """
+        x = x.to(self.device, self.dtype)
+        scores, ixs = [], []
+        for q in x.split(max(max_bytes // (4 * self.ntotal), 1)):
+            d = torch.matmul(q, self.big_npy.T).float()
+            d = self.norm - 2 * d + q.float().pow(2).sum(1, keepdim=True)
+            score, ix = torch.topk(d, k, dim=1, largest=False)
+            scores.append(score.clamp_min_(0))
+            ixs.append(ix)
+        return torch.cat(scores), torch.cat(ixs)
+
+    @torch.no_grad()
+    def blend(self, x: torch.Tensor, index_rate: float, k=8) -> torch.Tensor:
+        score, ix = self.search(x, k)
+        weight = torch.square(1 / score.clamp_min(1e-12))
+        weight /= weight.sum(dim=1, keepdim=True)
+        npy = torch.sum(self.big_npy[ix].float() * weight.unsqueeze(2), dim=1)
+        return npy.to(x.dtype) * index_rate + (1 - index_rate) * x
+
+
+class IndexCache(object):
+    """
+    进程内共享的 faiss 索引缓存, 以 (路径, mtime) 为键,
+    按 big_npy 占用字节数做 LRU 淘汰
+    """
+
+    def __init__(self, max_bytes: int = 2 << 30):
+        self.max_bytes = max_bytes
+        self.cur_bytes = 0
+        self.entries: OrderedDict = OrderedDict()
+        self.torch_entries = {}
+        self.lock = threading.Lock()
+
+    def load(self, index_path: str) -> Tuple[faiss.Index, np.ndarray]:
+        index_path = os.path.abspath(index_path)
+        key = (index_path, os.path.getmtime(index_path))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        index = faiss.read_index(index_path)
+        big_npy = index.reconstruct_n(0, index.ntotal)
+        with self.lock:
+            # 同一文件被改写后旧条目不会再命中, 直接丢弃
+            for old_key in [k for k in self.entries if k[0] == index_path]:
+                self._pop(old_key)
+            self.entries[key] = (index, big_npy)
+            self.cur_bytes += big_npy.nbytes
+            while self.cur_bytes > self.max_bytes and len(self.entries) > 1:
+                self._pop(next(iter(self.entries)))
+        return index, big_npy
+
+    def load_torch(
+        self, index_path: str, device, is_half=False
+    ) -> Optional[TorchIndex]:
+        """
+        返回常驻 device 的 TorchIndex, 显存不足时返回 None 以回退到 faiss
+        """
+        _, big_npy = self.load(index_path)
+        index_path = os.path.abspath(index_path)
+        key = (index_path, os.path.getmtime(index_path), str(device), is_half)
+        with self.lock:
+            if key in self.torch_entries:
+                return self.torch_entries[key]
+        device = torch.device(device)
+        if device.type == "cuda":
+            # 除常驻的 big_npy 外还需留出检索时距离矩阵与 gather 的空间
+            free, _ = torch.cuda.mem_get_info(device)
+            if free < big_npy.nbytes * 2 + (512 << 20):
+                logger.info("Not enough free memory on %s for index, use faiss", device)
+                return None
+        try:
+            torch_index = TorchIndex(big_npy, device, is_half)
+        except RuntimeError:  # OOM
+            logger.info("Failed to move index to %s, use faiss", device)
+            return None
+        with self.lock:
+            self.torch_entries[key] = torch_index
+        return torch_index
+
+    def _pop(self, key):
+        _, big_npy = self.entries.pop(key)
+        self.cur_bytes -= big_npy.nbytes
+        for torch_key in [k for k in self.torch_entries if k[:2] == key]:
+            del self.torch_entries[torch_key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.torch_entries.clear()
+            self.cur_bytes = 0
+
+
+index_cache = IndexCache(int(os.getenv("index_cache_bytes", 2 << 30)))
+
+
+def load_index(index_path: str) -> Tuple[faiss.Index, np.ndarray]:
+    return index_cache.load(index_path)
+
+
+def load_torch_index(index_path: str, device, is_half=False) -> Optional[TorchIndex]:
+    return index_cache.load_torch(index_path, device, is_half)
@@ -0,0 +1,167 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+import torch
+
+
+def _describe(x):
+    if isinstance(x, torch.Tensor):
+        return {
+            "shape": list(x.shape),
+            "dtype": str(x.dtype).replace("torch.", ""),
+            "bytes": x.numel() * x.element_size(),
+        }
+    if isinstance(x, np.ndarray):
+        return {"shape": list(x.shape), "dtype": str(x.dtype), "bytes": x.nbytes}
+    if isinstance(x, (list, tuple)):
+        return [_describe(i) for i in x]
+    return x
+
+
+class Profiler(object):
+    """
+    按阶段记录墙钟时间, 同步 device 后的时间, 峰值显存与张量尺寸,
+    可导出为 JSON 或 Chrome trace (chrome://tracing 或 ui.perfetto.dev 打开).
+
+    各阶段可在不同线程中重叠执行 (如 f0 与 hubert), 此时同步时间包含了
+    其他阶段在 device 上的工作, 峰值显存也是重叠期间的整体峰值
+    """
+
+    def __init__(self, device="cpu", enabled=True):
+        self.device = torch.device(device)
+        self.enabled = enabled
+        self.records = []
+        self.lock = threading.Lock()
+        self.n_active = 0
+        self.t0 = perf_counter()
+
+    def _synchronize(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+        elif self.device.type == "mps":
+            torch.mps.synchronize()
+
+    def _memory(self):
+        if self.device.type == "cuda":
+            return torch.cuda.max_memory_allocated(self.device)
+        if self.device.type == "mps":
+            return torch.mps.current_allocated_memory()
+        return None
+
+    @contextmanager
+    def stage(self, name, **tensors):
+        """
+        with profiler.stage("hubert", audio=audio) as sizes:
+            ...
+            sizes["feats"] = feats
+        """
+        sizes = dict(tensors)
+        if not self.enabled:
+            yield sizes
+            return
+        self._synchronize()
+        with self.lock:
+            if self.n_active == 0 and self.device.type == "cuda":
+                torch.cuda.reset_peak_memory_stats(self.device)
+            self.n_active += 1
+        start = perf_counter()
+        try:
+            yield sizes
+        finally:
+            wall = perf_counter() - start
+            self._synchronize()
+            synced = perf_counter() - start
+            record = {
+                "name": name,
+                "tid": threading.get_ident(),
+                "start": start - self.t0,
+                "wall": wall,
+                "synced": synced,
+                "peak_memory": self._memory(),
+                "tensors": {k: _describe(v) for k, v in sizes.items()},
+            }
+            with self.lock:
+                self.n_active -= 1
+                self.records.append(record)
+
+    def summary(self) -> OrderedDict:
+        """
+        按阶段名汇总次数, 总时间与最大峰值显存, 顺序为各阶段首次出现的顺序
+        """
+        result = OrderedDict()
+        for record in sorted(self.records, key=lambda r: r["start"]):
+            item = result.setdefault(
+                record["name"],
+                {"count": 0, "wall": 0.0, "synced": 0.0, "peak_memory": None},
+            )
+            item["count"] += 1
+            item["wall"] += record["wall"]
+            item["synced"] += record["synced"]
+            if record["peak_memory"] is not None:
+                item["peak_memory"] = max(
+                    item["peak_memory"] or 0, record["peak_memory"]
+                )
+        return result
+
+    def to_json(self) -> dict:
+        return {
+            "device": str(self.device),
+            "stages": sorted(self.records, key=lambda r: r["start"]),
+            "summary": self.summary(),
+        }
+
+    def to_chrome_trace(self) -> dict:
+        pid = os.getpid()
+        events = []
+        for record in self.records:
+            events.append(
+                {
+                    "name": record["name"],
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["synced"] * 1e6,
+                    "pid": pid,
+                    "tid": record["tid"],
+                    "args": {
+                        "wall_ms": record["wall"] * 1e3,
+                        "peak_memory": record["peak_memory"],
+                        "tensors": record["tensors"],
+                    },
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path: str):
+        """
+        文件名以 .trace.json 结尾时保存为 Chrome trace, 否则保存为 JSON
+        """
+        data = (
+            self.to_chrome_trace() if path.endswith(".trace.json") else self.to_json()
+        )
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+    def __str__(self):
+        return "\n".join(
+            "%s: %d calls, wall %.3fs, synced %.3fs%s"
+            % (
+                name,
+                item["count"],
+                item["wall"],
+                item["synced"],
+                (
+                    ", peak %.1fMB" % (item["peak_memory"] / (1 << 20))
+                    if item["peak_memory"] is not None
+                    else ""
+                ),
+            )
+            for name, item in self.summary().items()
+        )
+
+
+null_profiler = Profiler(enabled=False)
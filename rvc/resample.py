@@ -0,0 +1,130 @@
+import threading
+from math import ceil, gcd
+from typing import Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchaudio.transforms as tat
+
+_kernels = {}
+_lock = threading.Lock()
+
+
+def _get_kernel(orig_freq: int, new_freq: int, device, dtype, hq: bool):
+    """
+    按 (orig_freq, new_freq, device, dtype, hq) 缓存 torchaudio 的多相 sinc 核,
+    各组件共用. hq 为 True 时使用 kaiser_best 参数, 用于离线推理
+    """
+    key = (orig_freq, new_freq, str(device), dtype, hq)
+    with _lock:
+        if key not in _kernels:
+            kwargs = (
+                dict(
+                    lowpass_filter_width=64,
+                    rolloff=0.9475937167399596,
+                    resampling_method="sinc_interp_kaiser",
+                    beta=14.769656459379492,
+                )
+                if hq
+                else {}
+            )
+            resampler = tat.Resample(orig_freq, new_freq, dtype=dtype, **kwargs)
+            _kernels[key] = (resampler.kernel.to(device), resampler.width)
+        return _kernels[key]
+
+
+class Resampler(object):
+    """
+    与 torchaudio.transforms.Resample 结果一致的重采样, 核取自共享缓存.
+
+    __call__ 对整段音频重采样; stream 逐块输入, 携带滤波器状态, 输出与对
+    拼接后整段重采样相同, 但滞后约 (width + orig) 个输入点, flush 输出剩余部分
+    """
+
+    def __init__(
+        self,
+        orig_freq: int,
+        new_freq: int,
+        device="cpu",
+        dtype=torch.float32,
+        hq=False,
+    ):
+        g = gcd(int(orig_freq), int(new_freq))
+        self.orig = int(orig_freq) // g
+        self.new = int(new_freq) // g
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self.kernel, self.width = None, 0
+        if self.orig != self.new:
+            self.kernel, self.width = _get_kernel(
+                int(orig_freq), int(new_freq), self.device, dtype, hq
+            )
+        self.reset()
+
+    def _conv(self, x: torch.Tensor) -> torch.Tensor:
+        y = F.conv1d(x.reshape(-1, 1, x.shape[-1]), self.kernel, stride=self.orig)
+        return y.transpose(1, 2).reshape(*x.shape[:-1], -1)
+
+    def _to_tensor(self, x) -> torch.Tensor:
+        if not torch.is_tensor(x):
+            x = torch.from_numpy(np.ascontiguousarray(x))
+        return x.to(self.device, self.dtype)
+
+    def __call__(self, x: Union[np.ndarray, torch.Tensor]) -> torch.Tensor:
+        if self.orig == self.new:
+            return self._to_tensor(x)
+        x = self._to_tensor(x)
+        length = x.shape[-1]
+        y = self._conv(F.pad(x, (self.width, self.width + self.orig)))
+        return y[..., : ceil(self.new * length / self.orig)]
+
+    def reset(self):
+        # buffer 起点对应下一个待输出帧的第一个输入点, 开头补 width 个 0
+        self.buffer = torch.zeros(self.width, device=self.device, dtype=self.dtype)
+        self.n_in = 0
+        self.n_out = 0
+
+    def stream(self, x: Union[np.ndarray, torch.Tensor]) -> torch.Tensor:
+        """
+        x 为一维的新输入块, 返回可以确定的新输出
+        """
+        x = self._to_tensor(x)
+        if self.orig == self.new:
+            return x
+        self.n_in += x.shape[0]
+        self.buffer = torch.cat((self.buffer, x))
+        n_kernel = 2 * self.width + self.orig
+        if self.buffer.shape[0] < n_kernel:
+            return self.buffer[:0]
+        n_frames = (self.buffer.shape[0] - n_kernel) // self.orig + 1
+        y = self._conv(self.buffer[: (n_frames - 1) * self.orig + n_kernel])
+        self.buffer = self.buffer[n_frames * self.orig :]
+        self.n_out += y.shape[0]
+        return y
+
+    def flush(self) -> torch.Tensor:
+        """
+        输入结束, 补零输出剩余部分并重置状态
+        """
+        if self.orig == self.new:
+            return torch.zeros(0, device=self.device, dtype=self.dtype)
+        n_total = ceil(self.new * self.n_in / self.orig)
+        n_out = self.n_out
+        y = self.stream(
+            torch.zeros(self.width + self.orig, device=self.device, dtype=self.dtype)
+        )
+        y = y[: max(n_total - n_out, 0)]
+        self.reset()
+        return y
+
+
+def resample(
+    x: Union[np.ndarray, torch.Tensor],
+    orig_freq: int,
+    new_freq: int,
+    device="cpu",
+    dtype=torch.float32,
+    hq=False,
+) -> torch.Tensor:
+    return Resampler(orig_freq, new_freq, device, dtype, hq)(x)
@@ -0,0 +1,74 @@
+import torch
+
+
+def _acc_dtype(device) -> torch.dtype:
+    # 平方和在 float32 下会损失安静片段的精度, 支持时使用 float64
+    return (
+        torch.float64 if torch.device(device).type in ("cpu", "cuda") else torch.float32
+    )
+
+
+def frame_rms(x: torch.Tensor, frame_length: int, hop_length: int) -> torch.Tensor:
+    """
+    与 librosa.feature.rms(frame_length, hop_length, center=True) 一致,
+    要求 frame_length 为 hop_length 的偶数倍. 每帧恰好覆盖若干整 hop,
+    先对 hop 求平方和再滑窗相加, 不对音频做分帧拷贝. 会产生整段 float64 的临时张量,
+    用于实时的小块; 离线的长音频见 pipeline.frame_rms
+    """
+    k = frame_length // hop_length
+    if k * hop_length != frame_length or k % 2:
+        raise ValueError("frame_length must be an even multiple of hop_length")
+    n_hop = x.shape[0] // hop_length
+    n_tail = x.shape[0] - n_hop * hop_length
+    hop_sum = torch.zeros(n_hop + k, device=x.device, dtype=_acc_dtype(x.device))
+    hops = x[: n_hop * hop_length].view(n_hop, hop_length).to(hop_sum.dtype)
+    torch.sum(hops * hops, 1, out=hop_sum[k // 2 : k // 2 + n_hop])
+    if n_tail:
+        tail = x[n_hop * hop_length :].to(hop_sum.dtype)
+        hop_sum[k // 2 + n_hop] = torch.dot(tail, tail)
+    rms = torch.sqrt(hop_sum.unfold(0, k, 1).sum(1) / frame_length)
+    return rms.to(x.dtype)
+
+
+class RMSMixer(object):
+    """
+    实时响度混合: 两段音频各按 frame_rms 求包络, 与 F.interpolate(mode="linear",
+    align_corners=True) 相同地插值到采样点, 原地把 data2 乘以
+    (rms1 / max(rms2, 1e-3)) ** (1 - rate). 插值下标与权重按长度预先计算并复用
+    """
+
+    def __init__(self, frame_length: int, hop_length: int, device):
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.device = device
+        self.length = 0
+
+    def _prepare(self, length: int):
+        n_frames = 1 + length // self.hop_length
+        pos = torch.arange(length, dtype=torch.float64) * ((n_frames - 1) / length)
+        index = pos.floor().long().clamp_(max=max(n_frames - 2, 0))
+        self.index = index.to(self.device)
+        self.index_next = (index + 1).clamp_(max=n_frames - 1).to(self.device)
+        self.weight = (pos - index).float().to(self.device)
+        self.envelope = torch.zeros(2, n_frames, device=self.device)
+        self.length = length
+
+    def __call__(
+        self, data1: torch.Tensor, data2: torch.Tensor, rate: float
+    ) -> torch.Tensor:
+        """
+        data1 为输入音频, data2 为输出音频, rate 为 data2 响度的占比
+        """
+        length = data2.shape[0]
+        if length != self.length:
+            self._prepare(length)
+        self.envelope[0] = frame_rms(data1[:length], self.frame_length, self.hop_length)
+        self.envelope[1] = frame_rms(data2, self.frame_length, self.hop_length)
+        envelope = torch.lerp(
+            self.envelope[:, self.index],
+            self.envelope[:, self.index_next],
+            self.weight,
+        )
+        gain = envelope[0] / envelope[1].clamp_(min=1e-3)
+        data2 *= gain.pow_(1 - rate)
+        return data2
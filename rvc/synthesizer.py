@@ -1,3 +1,5 @@
+import os
+import threading
 from collections import OrderedDict
 
 import torch
@@ -21,18 +23,104 @@ def get_synthesizer(cpt: OrderedDict, device=torch.device("cpu")):
         use_f0=if_f0 == 1,
     )
     del net_g.enc_q
-    net_g.load_state_dict(cpt["weight"], strict=False)
+    fused = cpt.get("fused", False)
+    if fused:  # 权重已去除 weight norm, 先去除以对齐键名
+        net_g.remove_weight_norm()
+    _load_state_dict(net_g, cpt["weight"])
     net_g = net_g.float()
     net_g.eval().to(device)
-    net_g.remove_weight_norm()
+    if not fused:
+        net_g.remove_weight_norm()
     return net_g, cpt
 
 
-def load_synthesizer(pth_path: FileLike, device=torch.device("cpu")):  # type: ignore
-    return get_synthesizer(
-        torch.load(pth_path, map_location=torch.device("cpu"), weights_only=True),
-        device,
+def _load_state_dict(net_g: torch.nn.Module, state_dict: dict):
+    # assign 直接引用 state_dict 中的张量 (可能由 mmap 映射), 不再拷贝一份
+    try:
+        net_g.load_state_dict(state_dict, strict=False, assign=True)
+    except TypeError:  # torch < 2.1
+        net_g.load_state_dict(state_dict, strict=False)
+
+
+def load_synthesizer(
+    pth_path: FileLike, device=torch.device("cpu"), mmap=True  # type: ignore
+):
+    """
+    pth_path 为文件路径时以 mmap 方式读取, 权重位于可被同一主机上多个进程
+    共享的文件页中. 旧版 (非 zip) 格式或 torch < 2.1 时回退为普通读取
+    """
+    kwargs = {"map_location": torch.device("cpu"), "weights_only": True}
+    cpt = None
+    if mmap and isinstance(pth_path, (str, os.PathLike)):
+        try:
+            cpt = torch.load(pth_path, mmap=True, **kwargs)
+        except (TypeError, RuntimeError):
+            pass
+    if cpt is None:
+        cpt = torch.load(pth_path, **kwargs)
+    return get_synthesizer(cpt, device)
+
+
+def export_fused_synthesizer(pth_path: str, save_path: str, is_half=False):
+    """
+    保存已去除 weight norm, 且 dtype 即为推理 dtype 的权重. cpu 上以 mmap
+    加载这样的文件时参数不再发生任何拷贝, 多个进程共享同一份物理内存
+    """
+    net_g, cpt = load_synthesizer(pth_path, mmap=False)
+    if is_half:
+        net_g = net_g.half()
+    cpt = OrderedDict(cpt)
+    cpt["weight"] = OrderedDict(
+        (k, v.contiguous()) for k, v in net_g.state_dict().items()
     )
+    cpt["fused"] = True
+    torch.save(cpt, save_path)
+
+
+class SynthesizerPool(object):
+    """
+    常驻多个音色模型, 以 (路径, mtime) 为键, 按 device 上参数与 cpu 上
+    权重字典的总字节数做 LRU 淘汰, 至少保留最近使用的一个
+    """
+
+    def __init__(self, device, is_half: bool, max_bytes: int = 1 << 30):
+        self.device = device
+        self.is_half = is_half
+        self.max_bytes = max_bytes
+        self.cur_bytes = 0
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, pth_path: str):
+        pth_path = os.path.abspath(pth_path)
+        key = (pth_path, os.path.getmtime(pth_path))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][:2]
+        net_g, cpt = load_synthesizer(pth_path, self.device)
+        net_g = net_g.half() if self.is_half else net_g.float()
+        nbytes = sum(
+            t.numel() * t.element_size()
+            for t in list(net_g.parameters()) + list(cpt["weight"].values())
+        )
+        with self.lock:
+            for old_key in [k for k in self.entries if k[0] == pth_path]:
+                self._pop(old_key)
+            self.entries[key] = (net_g, cpt, nbytes)
+            self.cur_bytes += nbytes
+            while self.cur_bytes > self.max_bytes and len(self.entries) > 1:
+                self._pop(next(iter(self.entries)))
+        return net_g, cpt
+
+    def _pop(self, key):
+        _, _, nbytes = self.entries.pop(key)
+        self.cur_bytes -= nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.cur_bytes = 0
 
 
 def synthesizer_jit_export(
@@ -0,0 +1,135 @@
+import argparse
+import os
+import sys
+from time import perf_counter
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+import numpy as np
+
+####
+# USAGE
+#
+# python tools/cmd/bench_f0_interp.py --hours 1
+#
+# 在合成的长 f0 序列上比较 F0Predictor._interpolate_f0 与逐帧循环实现的耗时,
+# 并检查结果逐位一致
+
+
+def arg_parse() -> tuple:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument(
+        "--frame_rate", type=int, default=100, help="f0 frames per second"
+    )
+    parser.add_argument(
+        "--voiced_ratio", type=float, default=0.6, help="fraction of voiced frames"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1]
+
+    return args
+
+
+def interpolate_f0_loop(f0: np.ndarray):
+    """
+    逐帧循环的参考实现
+    """
+    data = np.reshape(f0, (f0.size, 1))
+
+    vuv_vector = np.zeros((data.size, 1), dtype=np.float32)
+    vuv_vector[data > 0.0] = 1.0
+    vuv_vector[data <= 0.0] = 0.0
+
+    ip_data = data
+
+    frame_number = data.size
+    last_value = 0.0
+    for i in range(frame_number):
+        if data[i] <= 0.0:
+            j = i + 1
+            for j in range(i + 1, frame_number):
+                if data[j] > 0.0:
+                    break
+            if j < frame_number - 1:
+                if last_value > 0.0:
+                    step = (data[j] - data[i - 1]) / float(j - i)
+                    for k in range(i, j):
+                        ip_data[k] = data[i - 1] + step * (k - i + 1)
+                else:
+                    for k in range(i, j):
+                        ip_data[k] = data[j]
+            else:
+                for k in range(i, frame_number):
+                    ip_data[k] = last_value
+        else:
+            ip_data[i] = data[i]
+            last_value = data[i]
+
+    return ip_data[:, 0], vuv_vector[:, 0]
+
+
+def synth_f0(n_frames: int, voiced_ratio: float, rng) -> np.ndarray:
+    """
+    浊音段与无声段交替, 段长服从几何分布 (平均约 0.3s 与 0.3s * (1 - r) / r)
+    """
+    mean_voiced = 30
+    mean_unvoiced = max(mean_voiced * (1 - voiced_ratio) / voiced_ratio, 1)
+    n_segments = int(2 * n_frames / (mean_voiced + mean_unvoiced)) + 2
+    lengths = np.empty(2 * n_segments, dtype=np.int64)
+    lengths[0::2] = rng.geometric(1 / mean_unvoiced, n_segments)
+    lengths[1::2] = rng.geometric(1 / mean_voiced, n_segments)
+    voiced = np.repeat(np.arange(lengths.shape[0]) % 2 == 1, lengths)[:n_frames]
+    f0 = 220 * 2 ** (np.cumsum(rng.normal(0, 0.01, n_frames)) % 2 - 1)
+    f0[~voiced] = 0
+    return f0
+
+
+def timeit(fn, f0: np.ndarray, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        x = f0.copy()
+        start = perf_counter()
+        result = fn(x)
+        best = min(best, perf_counter() - start)
+    return best, result
+
+
+def main():
+    args = arg_parse()
+
+    from rvc.f0.f0 import F0Predictor
+
+    predictor = F0Predictor(device="cpu")
+    rng = np.random.default_rng(args.seed)
+    n_frames = int(args.hours * 3600 * args.frame_rate)
+    f0 = synth_f0(n_frames, args.voiced_ratio, rng)
+    print(
+        "%d frames (%.2fh at %dfps), %.1f%% voiced"
+        % (n_frames, args.hours, args.frame_rate, 100 * np.mean(f0 > 0))
+    )
+    for dtype in (np.float64, np.float32):
+        x = f0.astype(dtype)
+        t_loop, (ip_loop, vuv_loop) = timeit(interpolate_f0_loop, x, args.repeat)
+        t_vec, (ip_vec, vuv_vec) = timeit(predictor._interpolate_f0, x, args.repeat)
+        identical = np.array_equal(ip_loop, ip_vec) and np.array_equal(
+            vuv_loop, vuv_vec
+        )
+        print(
+            "%-8s loop %8.1fms, vectorized %7.1fms, speedup %6.1fx, identical %s"
+            % (
+                np.dtype(dtype).name,
+                t_loop * 1000,
+                t_vec * 1000,
+                t_loop / t_vec,
+                identical,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
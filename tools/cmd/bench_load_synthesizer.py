@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import multiprocessing as mp
+from time import perf_counter
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+
+def arg_parse() -> tuple:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, required=True, help="path of .pth")
+    parser.add_argument(
+        "--fused", type=str, help="path of fused .pth, see export_fused_synthesizer"
+    )
+    parser.add_argument("--procs", type=int, default=4, help="worker processes")
+
+    return parser.parse_args()
+
+
+def memory_kb() -> dict:
+    # Linux only: Rss 为进程驻留内存, Pss 将共享页按共享进程数均摊
+    mem = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Dirty"):
+                mem[key] = int(value.split()[0])
+    return mem
+
+
+def worker(path, mmap, barrier, queue):
+    import torch
+    from rvc.synthesizer import load_synthesizer
+
+    torch.set_num_threads(1)
+    base = memory_kb()
+    t0 = perf_counter()
+    net_g, cpt = load_synthesizer(path, mmap=mmap)
+    cost = perf_counter() - t0
+    # 所有进程都加载完成后再统计, 使共享页被均摊
+    barrier.wait()
+    mem = memory_kb()
+    queue.put((cost, {k: mem[k] - base[k] for k in mem}))
+    barrier.wait()
+
+
+def run(path, mmap, procs):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(procs)
+    queue = ctx.Queue()
+    workers = [
+        ctx.Process(target=worker, args=(path, mmap, barrier, queue))
+        for _ in range(procs)
+    ]
+    for p in workers:
+        p.start()
+    results = [queue.get() for _ in workers]
+    for p in workers:
+        p.join()
+    cost = sum(r[0] for r in results) / procs
+    mem = {k: sum(r[1][k] for r in results) / 1024 for k in results[0][1]}
+    print(
+        "%-40s load %.3fs/proc, total Rss %.1fMB, Pss %.1fMB, Private_Dirty %.1fMB"
+        % (
+            "%s (mmap=%s)" % (os.path.basename(path), mmap),
+            cost,
+            mem["Rss"],
+            mem["Pss"],
+            mem["Private_Dirty"],
+        )
+    )
+
+
+def main():
+    args = arg_parse()
+    run(args.model, False, args.procs)
+    run(args.model, True, args.procs)
+    if args.fused:
+        run(args.fused, True, args.procs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+from time import perf_counter
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+import numpy as np
+from scipy import signal
+
+from infer.modules.vc.pipeline import bh, ah, get_opt_ts
+
+
+def arg_parse() -> tuple:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=10, help="input length")
+    parser.add_argument("--x_query", type=int, default=6, help="x_query in config")
+    parser.add_argument("--x_center", type=int, default=38, help="x_center in config")
+    parser.add_argument("--repeat", type=int, default=3, help="repeat times")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+
+    return parser.parse_args()
+
+
+def get_opt_ts_loop(audio_pad, window, t_center, t_query):
+    # Pipeline.pipeline 原先的实现, 作为对照
+    audio = audio_pad[window // 2 : -(window // 2)]
+    opt_ts = []
+    audio_sum = np.zeros_like(audio)
+    for i in range(window):
+        audio_sum += np.abs(audio_pad[i : i - window])
+    for t in range(t_center, audio.shape[0], t_center):
+        opt_ts.append(
+            t
+            - t_query
+            + np.where(
+                audio_sum[t - t_query : t + t_query]
+                == audio_sum[t - t_query : t + t_query].min()
+            )[0][0]
+        )
+    return opt_ts
+
+
+def synth_audio(n: int, sr: int, rng: np.random.Generator) -> np.ndarray:
+    # 0.2~3s 的有声段与 0.05~0.8s 的静音段交替
+    audio = np.zeros(n)
+    i = 0
+    while i < n:
+        voiced = int(rng.uniform(0.2, 3) * sr)
+        t = np.arange(min(voiced, n - i)) / sr
+        audio[i : i + voiced] = (
+            0.3 * np.sin(2 * np.pi * rng.uniform(100, 400) * t)
+            + 0.05 * rng.standard_normal(t.shape[0])
+        ) * np.hanning(t.shape[0])
+        i += voiced + int(rng.uniform(0.05, 0.8) * sr)
+    return audio + 1e-4 * rng.standard_normal(n)
+
+
+def main():
+    args = arg_parse()
+    sr, window = 16000, 160
+    t_query, t_center = sr * args.x_query, sr * args.x_center
+    rng = np.random.default_rng(args.seed)
+    audio = signal.filtfilt(bh, ah, synth_audio(int(args.minutes * 60 * sr), sr, rng))
+    audio_pad = np.pad(audio, (window // 2, window // 2), mode="reflect")
+
+    for name, fn in (("loop", get_opt_ts_loop), ("vectorized", get_opt_ts)):
+        cost = []
+        for _ in range(args.repeat):
+            t0 = perf_counter()
+            opt_ts = fn(audio_pad, window, t_center, t_query)
+            cost.append(perf_counter() - t0)
+        print("%s: best %.3fs, %d cut points" % (name, min(cost), len(opt_ts)))
+        if name == "loop":
+            ref = [int(t) for t in opt_ts]
+    print("match: %s" % (ref == opt_ts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+from time import perf_counter
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+from dotenv import load_dotenv
+
+import numpy as np
+
+####
+# USAGE
+#
+# python tools/cmd/bench_realtime.py --pth_path assets/weights/xxx.pth \
+#     --input_path test.wav --block_time 0.25 --f0method rmvpe
+#
+# 按实时变声的方式逐块处理 wav, 统计每块耗时分布与模拟播放时钟下的欠载次数
+
+
+def arg_parse() -> tuple:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pth_path", type=str, required=True, help="model path")
+    parser.add_argument("--index_path", type=str, default="", help="index path")
+    parser.add_argument("--input_path", type=str, required=True, help="input wav")
+    parser.add_argument("--opt_path", type=str, help="save converted wav")
+    parser.add_argument("--samplerate", type=int, help="default: model samplerate")
+    parser.add_argument("--block_time", type=float, default=0.25)
+    parser.add_argument("--extra_time", type=float, default=2.5)
+    parser.add_argument("--crossfade_length", type=float, default=0.05)
+    parser.add_argument("--f0method", type=str, default="rmvpe")
+    parser.add_argument("--pitch", type=int, default=0)
+    parser.add_argument("--formant", type=float, default=0.0)
+    parser.add_argument("--index_rate", type=float, default=0.0)
+    parser.add_argument("--rms_mix_rate", type=float, default=0.0)
+    parser.add_argument("--threhold", type=int, default=-60)
+    parser.add_argument("--gate_attack", type=float, default=0.0)
+    parser.add_argument("--gate_release", type=float, default=0.0)
+    parser.add_argument("--I_noise_reduce", action="store_true")
+    parser.add_argument("--O_noise_reduce", action="store_true")
+    parser.add_argument("--use_pv", action="store_true")
+    parser.add_argument("--index_on_device", action="store_true")
+    parser.add_argument("--incremental_hubert", action="store_true")
+    parser.add_argument(
+        "--warmup", type=int, default=3, help="blocks excluded from statistics"
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="save per-stage profile to this path, *.trace.json for chrome trace",
+    )
+
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1]
+
+    return args
+
+
+def simulate_playback(costs: np.ndarray, block_time: float) -> tuple:
+    """
+    第 i 块在 (i+1)*block_time 时采集完毕, 处理串行进行, 需在下一块采集完毕
+    (即声卡回调再次到来) 前完成, 否则输出欠载. 返回 (每块排队+处理延迟, 欠载数)
+    """
+    ready = (np.arange(len(costs)) + 1) * block_time
+    finish = np.empty_like(ready)
+    busy = 0.0
+    for i, cost in enumerate(costs):
+        busy = max(busy, ready[i]) + cost
+        finish[i] = busy
+    delays = finish - ready
+    return delays, int(np.sum(delays > block_time))
+
+
+def main():
+    load_dotenv()
+    args = arg_parse()
+
+    import librosa
+    from scipy.io import wavfile
+
+    from configs import Config
+    from infer.lib.rtengine import GUIConfig, RealtimeEngine
+    from rvc.profiler import Profiler
+
+    config = Config()
+    gui_config = GUIConfig()
+    gui_config.pth_path = args.pth_path
+    gui_config.index_path = args.index_path
+    gui_config.pitch = args.pitch
+    gui_config.formant = args.formant
+    gui_config.index_rate = args.index_rate
+    gui_config.rms_mix_rate = args.rms_mix_rate
+    gui_config.threhold = args.threhold
+    gui_config.gate_attack = args.gate_attack
+    gui_config.gate_release = args.gate_release
+    gui_config.block_time = args.block_time
+    gui_config.extra_time = args.extra_time
+    gui_config.crossfade_time = args.crossfade_length
+    gui_config.I_noise_reduce = args.I_noise_reduce
+    gui_config.O_noise_reduce = args.O_noise_reduce
+    gui_config.use_pv = args.use_pv
+    gui_config.index_on_device = args.index_on_device
+    gui_config.incremental_hubert = args.incremental_hubert
+    gui_config.f0method = args.f0method
+    engine = RealtimeEngine(gui_config, config, args.samplerate)
+
+    audio, _ = librosa.load(args.input_path, sr=engine.samplerate, mono=True)
+    n_blocks = len(audio) // engine.block_frame
+    if n_blocks <= args.warmup:
+        raise ValueError(
+            "input too short: %d blocks, warmup %d" % (n_blocks, args.warmup)
+        )
+    profiler = Profiler(config.device)
+    costs = np.zeros(n_blocks)
+    outputs = []
+    for i in range(n_blocks):
+        if i == args.warmup:
+            profiler.records.clear()
+        block = audio[i * engine.block_frame : (i + 1) * engine.block_frame]
+        start = perf_counter()
+        outputs.append(engine.process(block, profiler=profiler))
+        costs[i] = perf_counter() - start
+
+    engine.close()
+    costs = costs[args.warmup :]
+    delays, underruns = simulate_playback(costs, engine.block_frame / engine.samplerate)
+    block_ms = engine.block_frame / engine.samplerate * 1000
+    print(
+        "device %s, samplerate %d, block %.1fms, algorithm delay %.1fms, %d blocks"
+        % (
+            config.device,
+            engine.samplerate,
+            block_ms,
+            engine.delay_time * 1000,
+            len(costs),
+        )
+    )
+    for name, values in (("process", costs), ("queue+process", delays)):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        print(
+            "%-14s p50 %.1fms, p95 %.1fms, p99 %.1fms, max %.1fms"
+            % (name, p50, p95, p99, values.max() * 1000)
+        )
+    print(
+        "underruns %d/%d (%.1f%%), realtime factor %.2f"
+        % (
+            underruns,
+            len(costs),
+            100 * underruns / len(costs),
+            costs.mean() * 1000 / block_ms,
+        )
+    )
+    print("per block:")
+    for name, item in profiler.summary().items():
+        print(
+            "  %-10s %8.2fms  (%d calls)"
+            % (name, item["synced"] * 1000 / len(costs), item["count"])
+        )
+    if args.profile:
+        profiler.save(args.profile)
+    if args.opt_path:
+        wavfile.write(args.opt_path, engine.samplerate, np.concatenate(outputs)[:, 0])
+
+
+if __name__ == "__main__":
+    main()
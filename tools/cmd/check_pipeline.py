@@ -0,0 +1,156 @@
+import argparse
+import os
+import sys
+import types
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+import librosa
+import numpy as np
+import torch
+import torch.nn.functional as F
+from scipy import signal
+
+from infer.modules.vc.pipeline import Pipeline, bh, ah, change_rms
+
+####
+# USAGE
+#
+# python tools/cmd/check_pipeline.py --seconds 100
+#
+# 用随机初始化的小模型代替 hubert 与 net_g, 不需要下载任何权重.
+# 以不同 rms_mix_rate 与 batch_size 跑通 Pipeline.pipeline, 检查输出一致,
+# 并把 change_rms 与原先基于 librosa 的实现对照
+
+
+def arg_parse() -> tuple:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=100, help="input length")
+    parser.add_argument("--tgt_sr", type=int, default=40000)
+    parser.add_argument("--seed", type=int, default=0)
+
+    return parser.parse_args()
+
+
+class StandInHubert(torch.nn.Module):
+    # 与 hubert 相同的 20ms 帧移与 768 维输出
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv1d(1, 768, 400, 320)
+        self.feature_extractor = types.SimpleNamespace(
+            conv_layers=[torch.nn.Sequential(self.conv)]
+        )
+
+    def extract_features(self, source, padding_mask, output_layer):
+        return (self.conv(source.unsqueeze(1)).transpose(1, 2),)
+
+    def final_proj(self, x):
+        return x
+
+
+class StandInSynthesizer(torch.nn.Module):
+    # 每帧 f0 控制一段正弦, 幅度由特征决定, 输出 (batch, 1, p_len * upp)
+    def __init__(self, tgt_sr: int):
+        super().__init__()
+        self.tgt_sr = tgt_sr
+        self.upp = tgt_sr // 100
+        self.proj = torch.nn.Linear(768, 1)
+
+    def infer(self, feats, p_len, sid, pitch=None, pitchf=None):
+        amp = torch.sigmoid(self.proj(feats))[..., 0].repeat_interleave(self.upp, 1)
+        if pitchf is None:
+            return (0.1 * amp).unsqueeze(1)
+        freq = pitchf.float().repeat_interleave(self.upp, 1) / self.tgt_sr
+        return (0.5 * amp * torch.sin(2 * np.pi * torch.cumsum(freq, 1))).unsqueeze(1)
+
+
+class SynthF0(object):
+    # 代替 rvc.f0.Generator, 返回与 calculate 相同格式的固定 f0
+    def calculate(self, x, p_len, f0_up_key, f0_method, filter_radius, manual_f0):
+        f0 = 150 + 100 * np.sin(np.arange(p_len) / 50)
+        f0[np.arange(p_len) % 300 > 240] = 0
+        f0 *= 2 ** (f0_up_key / 12)
+        f0_mel = 1127 * np.log(1 + f0 / 700)
+        return np.clip(np.rint(f0_mel / 5), 1, 255).astype(np.int32), f0
+
+
+def change_rms_librosa(data1, sr1, data2, sr2, rate):
+    # change_rms 原先的实现, 作为对照
+    rms1 = librosa.feature.rms(y=data1, frame_length=sr1 // 2 * 2, hop_length=sr1 // 2)
+    rms2 = librosa.feature.rms(y=data2, frame_length=sr2 // 2 * 2, hop_length=sr2 // 2)
+    rms1 = F.interpolate(
+        torch.from_numpy(rms1).unsqueeze(0), size=data2.shape[0], mode="linear"
+    ).squeeze()
+    rms2 = F.interpolate(
+        torch.from_numpy(rms2).unsqueeze(0), size=data2.shape[0], mode="linear"
+    ).squeeze()
+    rms2 = torch.clamp(rms2, min=1e-6)
+    return data2 * (rms1 ** (1 - rate) * rms2 ** (rate - 1)).numpy()
+
+
+def main():
+    args = arg_parse()
+
+    torch.manual_seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    n = int(args.seconds * 16000)
+    # 每秒音量随机的正弦加噪声
+    envelope = rng.uniform(0, 0.5, n // 16000 + 1).repeat(16000)[:n]
+    audio = np.sin(np.arange(n) / 30) * envelope + 0.01 * rng.standard_normal(n)
+    audio = audio.astype(np.float32)
+
+    # filtfilt 的结果是负步长的视图, 与 pipeline 中一致
+    filtered = signal.filtfilt(bh, ah, audio)
+    data2 = (rng.standard_normal(n * args.tgt_sr // 16000) * 0.1).astype(np.float32)
+    for rate in (0.0, 0.25, 0.5):
+        ref = change_rms_librosa(
+            filtered.copy(), 16000, data2.copy(), args.tgt_sr, rate
+        )
+        out = change_rms(filtered, 16000, data2.copy(), args.tgt_sr, rate)
+        err = np.abs(out - ref).max() / np.abs(ref).max()
+        print("change_rms rate %.2f: max relative error %.2e" % (rate, err))
+        assert err < 1e-4, err
+
+    config = types.SimpleNamespace(
+        x_pad=1, x_query=6, x_center=38, x_max=41, is_half=False, device="cpu"
+    )
+    pipeline = Pipeline(args.tgt_sr, config, SynthF0())
+    hubert = StandInHubert().eval()
+    net_g = StandInSynthesizer(args.tgt_sr).eval()
+    for if_f0 in (1, 0):
+        for rate in (1.0, 0.25):
+            outs = []
+            for batch_size in (1, 3):
+                times = [0, 0, 0, 0]
+                out = pipeline.pipeline(
+                    hubert,
+                    net_g,
+                    0,
+                    audio.copy(),
+                    times,
+                    0,
+                    "rmvpe",
+                    "",
+                    0,
+                    if_f0,
+                    3,
+                    args.tgt_sr,
+                    0,
+                    rate,
+                    "v2",
+                    0.33,
+                    batch_size=batch_size,
+                )
+                assert np.isfinite(out).all()
+                outs.append(out)
+            diff = np.abs(outs[0] - outs[1]).max()
+            print(
+                "if_f0 %d rms_mix_rate %.2f: %d samples, batch 1 vs 3 max diff %.3g"
+                % (if_f0, rate, outs[0].shape[0], diff)
+            )
+            assert outs[0].shape == outs[1].shape
+    pipeline.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,17 @@ def arg_parse() -> tuple:
     parser.add_argument("--resample_sr", type=int, default=0, help="resample sr")
     parser.add_argument("--rms_mix_rate", type=float, default=1, help="rms mix rate")
     parser.add_argument("--protect", type=float, default=0.33, help="protect")
+    parser.add_argument(
+        "--f0_n_cpu", type=int, default=1, help="processes for dio/harvest f0"
+    )
+    parser.add_argument(
+        "--index_on_device",
+        action="store_true",
+        help="keep the index on the device for exact top-k search",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=1, help="segments per forward pass"
+    )
 
     args = parser.parse_args()
     sys.argv = sys.argv[:1]
@@ -44,6 +55,8 @@ def main():
     config = Config()
     config.device = args.device if args.device else config.device
     config.is_half = args.is_half if args.is_half else config.is_half
+    config.f0_n_cpu = args.f0_n_cpu
+    config.index_on_device = args.index_on_device
     vc = VC(config)
     vc.get_vc(args.model_name)
     audios = os.listdir(args.input_path)
@@ -63,9 +76,11 @@ def main():
                 args.resample_sr,
                 args.rms_mix_rate,
                 args.protect,
+                args.batch_size,
             )
             out_path = os.path.join(args.opt_path, file)
             wavfile.write(out_path, wav_opt[0], wav_opt[1])
+    vc.close()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import argparse
 import os
 import sys
+import wave
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
@@ -9,6 +10,7 @@ from scipy.io import wavfile
 
 from configs import Config
 from infer.modules.vc import VC
+from rvc.profiler import Profiler, null_profiler
 
 ####
 # USAGE
@@ -31,6 +33,24 @@ def arg_parse() -> tuple:
     parser.add_argument("--resample_sr", type=int, default=0, help="resample sr")
     parser.add_argument("--rms_mix_rate", type=float, default=1, help="rms mix rate")
     parser.add_argument("--protect", type=float, default=0.33, help="protect")
+    parser.add_argument(
+        "--f0_n_cpu", type=int, default=1, help="processes for dio/harvest f0"
+    )
+    parser.add_argument(
+        "--index_on_device",
+        action="store_true",
+        help="keep the index on the device for exact top-k search",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="write the output segment by segment with bounded memory",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="save per-stage profile to this path, *.trace.json for chrome trace",
+    )
 
     args = parser.parse_args()
     sys.argv = sys.argv[:1]
@@ -44,8 +64,35 @@ def main():
     config = Config()
     config.device = args.device if args.device else config.device
     config.is_half = args.is_half if args.is_half else config.is_half
+    config.f0_n_cpu = args.f0_n_cpu
+    config.index_on_device = args.index_on_device
     vc = VC(config)
     vc.get_vc(args.model_name)
+    if args.stream:
+        # 逐段写入 16 位 wav, 不在内存中保留整段输出
+        with wave.open(args.opt_path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            for i, (sr, audio_opt) in enumerate(
+                vc.vc_stream(
+                    0,
+                    args.input_path,
+                    args.f0up_key,
+                    args.f0method,
+                    args.index_path,
+                    args.index_rate,
+                    args.filter_radius,
+                    args.resample_sr,
+                    args.rms_mix_rate,
+                    args.protect,
+                )
+            ):
+                if i == 0:
+                    wf.setframerate(sr)
+                wf.writeframes(audio_opt.tobytes())
+        vc.close()
+        return
+    profiler = Profiler(config.device) if args.profile else null_profiler
     _, wav_opt = vc.vc_single(
         0,
         args.input_path,
@@ -59,8 +106,13 @@ def main():
         args.resample_sr,
         args.rms_mix_rate,
         args.protect,
+        profiler=profiler,
     )
     wavfile.write(args.opt_path, wav_opt[0], wav_opt[1])
+    vc.close()
+    if args.profile:
+        print(profiler)
+        profiler.save(args.profile)
 
 
 if __name__ == "__main__":